@@ -1,33 +1,461 @@
-from fastmcp import FastMCP
+from fastmcp import Context, FastMCP
+from fastmcp.server.middleware import Middleware, MiddlewareContext
+import asyncio
+import bisect
+import codecs
+import concurrent.futures
+import functools
+import itertools
 import httpx
+import importlib.util
+import json
+import os
+import random
+import re
 import sys
-from typing import Optional, Dict, List, Union
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable, Optional, Dict, List, Tuple, Union
+
+# orjson, when installed, decodes whole JSON responses several times faster than the json module
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """
+    Start the warm-up and the alert/metric pollers in the background, so the server is
+    ready at once, and release pooled controller connections on shutdown
+    """
+    warmup_task = start_warmup()
+    pollers = start_pollers()
+    try:
+        yield
+    finally:
+        if warmup_task is not None:
+            warmup_task.cancel()
+            await asyncio.gather(warmup_task, return_exceptions=True)
+        await stop_pollers(pollers)
+        await close_controllers()
 
 # Create an MCP server
-mcp = FastMCP("Apstra MCP server")
+mcp = FastMCP("Apstra MCP server", lifespan=lifespan)
 
-# IP of Cloudlabs AOS Server
+# IP of Cloudlabs AOS Server. Like every setting below, these can be set with
+# APSTRA_SERVER/APSTRA_USERNAME/APSTRA_PASSWORD or an APSTRA_CONFIG file (see load_settings).
 aos_server = 'Your Apstra Instance ID'
 username = 'XXX'
 password = 'YYY'
 
-# Token cache to avoid repeated auth calls
-_token_cache: Optional[Dict[str, str]] = None
+# Warm-up at server start: log in to every controller and prefetch the Apstra version,
+# design templates, chassis profiles and blueprint list in the background (see warm_up).
+# Skipped when replaying recorded traffic.
+warmup = False
+
+# Several controllers can be registered through the APSTRA_CONTROLLERS file
+# (see load_controllers). Tools take an optional `instance` argument to pick
+# one; some accept ALL_INSTANCES to query every controller concurrently.
+ALL_INSTANCES = '*'
+
+# HTTP connection pool settings for the Apstra controller
+http2 = True                # only used when the 'h2' package is installed
+max_connections = 20
+max_keepalive_connections = 10
+keepalive_expiry = 30.0     # seconds an idle connection is kept open
+request_timeout = 5.0       # default per-request timeout in seconds
+max_concurrent_requests = 10  # in-flight requests allowed per controller
+# Custom httpx transport used by every controller instead of the network
+# (e.g. the mock controller in bench/); None sends real requests
+http_transport: Optional[httpx.AsyncBaseTransport] = None
+
+# Record/replay of upstream traffic as JSON Lines (gzip-compressed if the name ends in .gz).
+# APSTRA_RECORD=<file> appends every request and response; APSTRA_REPLAY=<file> serves
+# the recorded responses instead of a controller. Values of redact_keys (case-insensitive)
+# are masked in recorded JSON bodies; headers are never recorded.
+record_path: Optional[str] = os.environ.get('APSTRA_RECORD')
+replay_path: Optional[str] = os.environ.get('APSTRA_REPLAY')
+replay_latency = 0.0        # share of the recorded latency reproduced on replay (1.0 = as recorded)
+redact_keys = {'password', 'token', 'authtoken', 'api_key', 'secret', 'private_key'}
+
+# Per-endpoint timeout profiles (seconds) overriding request_timeout.
+# The first (method, path pattern) that matches wins; a method of None matches any.
+timeout_profiles = [
+    ("DELETE", r"^/api/blueprints/[^/]+$", 30.0),
+    ("POST", r"^/api/blueprints$", 30.0),
+    ("PUT", r"^/api/blueprints/[^/]+/deploy$", 30.0),
+    (None, r"^/api/metricdb/", 30.0),
+    ("POST", r"^/api/blueprints/[^/]+/qe$", 30.0),
+]
+
+# Retries with jittered exponential backoff. Idempotent requests are retried on
+# connection errors, timeouts and 502/503/504; writes only when it is safe (see _send).
+max_retries = 3
+retry_backoff_base = 0.5
+retry_backoff_max = 8.0
+
+# Telemetry: latency histogram buckets (seconds) and the HTTP path of the
+# Prometheus text endpoint (served with HTTP transports only; None disables it)
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+prometheus_metrics_path: Optional[str] = "/metrics"
+
+# Circuit breaker per controller: after breaker_failure_threshold consecutive
+# failures, calls fail fast for breaker_reset_timeout seconds before one trial request.
+breaker_failure_threshold = 5
+breaker_reset_timeout = 30.0
+
+# Session token lifetime. Tokens are refreshed in the background once they
+# are within token_refresh_margin seconds of token_ttl.
+token_ttl = 3600.0
+token_refresh_margin = 300.0
+
+# Response cache for near-static catalog endpoints: entry limit and TTL (seconds) per path
+cache_max_entries = 256
+catalog_cache_ttl = {
+    '/api/versions/server': 3600.0,
+    '/api/design/templates': 300.0,
+    '/api/chassis-profiles': 600.0,
+    '/api/device-os/platforms': 600.0,
+    '/api/resources/vni-pools': 300.0,
+}
+# The blueprint list (get_bp) is cached briefly; our own creates and deletes clear it
+blueprint_list_cache_ttl = 30.0
+
+# Per-blueprint reads are cached against the blueprint version. The version is
+# probed from diff-status and the probe is reused for a short time to absorb bursts.
+blueprint_cache_ttl = 900.0
+blueprint_version_probe_ttl = 2.0
+
+# Largest page (in bytes of JSON) returned by the paged list tools. Larger
+# results are cut short and come back with a continuation cursor.
+max_response_bytes = 256_000
+# Read size for streamed responses (systems, metrics, alerts), parsed item by item
+stream_chunk_size = 65_536
+
+# Virtual network creates in flight at once for create_vns_bulk
+bulk_max_concurrency = 8
+
+# Sub-requests in flight at once for get_fabric_snapshot
+snapshot_parallelism = 8
+
+# Background polling of alert events and metricdb series into per-controller ring
+# buffers read by get_alerts_since/get_metrics_since. An interval of None disables the
+# poller (the tools then poll once per call). metric_poll_series selects metric names
+# (empty keeps every series); event_buffer_size is the number of records kept.
+alert_poll_interval: Optional[float] = None
+metric_poll_interval: Optional[float] = None
+metric_poll_series: List[str] = []
+event_buffer_size = 10_000
+
+# Compiled graph queries kept by query_blueprint (results are cached per blueprint version)
+compiled_query_cache_size = 256
+
+# Ranges the allocator hands out from (see create_security_zone/create_vn allocate=True).
+# VNIs come from the controller's VNI pools; vni_range is used only when none are defined.
+vlan_range = (2, 4094)
+vni_range = (4096, 16777214)
+# How long a created VNI/VLAN stays reserved if no rebuilt blueprint index lists it (deleted meanwhile)
+resource_hold_ttl = 300.0
+
+# In-memory graph mirrors (nodes and relationships) of the most recently queried blueprints
+graph_max_blueprints = 8
+
+# deploy_and_wait polls diff-status with exponential backoff between these bounds (seconds)
+deploy_poll_initial = 1.0
+deploy_poll_max = 15.0
+deploy_timeout = 600.0
+
+# Settings read from APSTRA_CONFIG and APSTRA_<NAME>: every plain value defined above.
+# APSTRA_SERVER and a "server" key in the file set aos_server.
+_SETTINGS = frozenset(
+    name for name, value in globals().items()
+    if not name.startswith('_') and name.islower() and name != 'http_transport'
+    and isinstance(value, (bool, int, float, str, tuple, list, dict, set, type(None)))
+)
+_SETTING_ALIASES = {'server': 'aos_server'}
+# Types of the settings that may be None (unset); the others take the type of their default
+_SETTING_TYPES = {
+    'record_path': str,
+    'replay_path': str,
+    'prometheus_metrics_path': str,
+    'alert_poll_interval': float,
+    'metric_poll_interval': float,
+}
+# Contents of the APSTRA_CONFIG file; its "controllers" and "default" keys are read by load_controllers
+_config_file: Dict[str, Any] = {}
+
+def _setting_value(name: str, value: Any, from_env: bool) -> Any:
+    """Convert a configured value to the setting's declared type, or that of its default"""
+    current = globals()[name]
+    kind = _SETTING_TYPES.get(name, type(current))
+    if from_env and kind is not str:
+        if kind is bool:
+            return value.strip().lower() in ('1', 'true', 'yes', 'on')
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValueError(f"APSTRA_{name.upper()} must be JSON, got {value!r}")
+    if value is None and name in _SETTING_TYPES:
+        return None
+    if kind is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(current, tuple):
+        return tuple(tuple(v) if isinstance(v, list) else v for v in value)
+    if isinstance(current, set):
+        return set(value)
+    if isinstance(current, dict):
+        return dict(current, **value)
+    if not isinstance(value, kind):
+        raise ValueError(f"{name} must be of type {kind.__name__}, got {value!r}")
+    return value
+
+def load_settings() -> None:
+    """
+    Override the settings above from the JSON file named by APSTRA_CONFIG, then from
+    APSTRA_<NAME> environment variables (e.g. APSTRA_REQUEST_TIMEOUT=10, APSTRA_WARMUP=true).
+    Unknown or invalid values, and a missing or malformed file, are reported on stderr
+    and the defaults are kept.
+    """
+    global _config_file
+    path = os.environ.get('APSTRA_CONFIG')
+    if path:
+        try:
+            with open(path) as f:
+                config = json.load(f)
+            if not isinstance(config, dict):
+                raise ValueError("expected a JSON object")
+            _config_file = config
+        except (OSError, ValueError) as e:
+            print(f"Ignoring config file {path}: {e}", file=sys.stderr)
+    updates = [(key, value, False) for key, value in _config_file.items() if key not in ('controllers', 'default')]
+    for name in sorted(_SETTINGS | set(_SETTING_ALIASES)):
+        env = os.environ.get(f'APSTRA_{name.upper()}')
+        if env is not None:
+            updates.append((name, env, True))
+    for key, value, from_env in updates:
+        name = _SETTING_ALIASES.get(key, key)
+        if name not in _SETTINGS:
+            print(f"Ignoring unknown setting '{key}' in {path}", file=sys.stderr)
+            continue
+        try:
+            globals()[name] = _setting_value(name, value, from_env)
+        except (TypeError, ValueError) as e:
+            print(f"Ignoring setting '{key}': {e}", file=sys.stderr)
+
+load_settings()
+
+_MISSING = object()
+
+class TTLCache:
+    """
+    Bounded in-process cache. Entries expire after their own TTL and the
+    least recently used entry is evicted once maxsize is reached.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value for key, or _MISSING if absent or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return _MISSING
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self, predicate: Optional[Callable[[Hashable], bool]] = None) -> int:
+        """Remove all entries, or only those whose key matches predicate. Returns the count removed."""
+        with self._lock:
+            if predicate is None:
+                removed = len(self._data)
+                self._data.clear()
+                return removed
+            keys = [k for k in self._data if predicate(k)]
+            for k in keys:
+                del self._data[k]
+            return len(keys)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+class Histogram:
+    """Cumulative latency histogram over latency_buckets, with count, sum and max"""
+    __slots__ = ('buckets', 'counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = latency_buckets
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile, capped at the observed max"""
+        rank, seen = q * self.count, 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+        return 0.0
+
+    def summary(self) -> Dict[str, float]:
+        """Latency summary in milliseconds"""
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 1) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.5) * 1000, 1),
+            "p95_ms": round(self.quantile(0.95) * 1000, 1),
+            "p99_ms": round(self.quantile(0.99) * 1000, 1),
+            "max_ms": round(self.max * 1000, 1)
+        }
 
-def auth(aos_server: str, username: str, password: str) -> Optional[Dict[str, str]]:
+class _CallStats:
+    __slots__ = ('latency', 'errors', 'statuses', 'bytes', 'retries')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.statuses: Counter = Counter()
+        self.bytes = 0
+        self.retries = 0
+
+# Blueprint IDs are folded out of upstream paths so endpoints aggregate across blueprints
+_BLUEPRINT_PATH = re.compile(r"^/api/blueprints/[^/]+")
+
+def _endpoint(url: str) -> str:
+    return _BLUEPRINT_PATH.sub("/api/blueprints/{id}", httpx.URL(url).path)
+
+class Telemetry:
     """
-    Authenticate with the AOS server and return headers with AuthToken.
-    Uses cached token if available.
+    Process-wide counters for tool calls and upstream HTTP requests:
+    latency histograms, errors, status codes, response bytes and retries.
     """
-    global _token_cache
-    if _token_cache:
-        return _token_cache
 
+    def __init__(self):
+        self.started = time.time()
+        self.tools: Dict[str, _CallStats] = {}
+        self.upstream: Dict[Tuple[str, str, str], _CallStats] = {}
+        self._lock = threading.Lock()
+
+    def record_tool(self, name: str, seconds: float, failed: bool) -> None:
+        with self._lock:
+            stats = self.tools.get(name) or self.tools.setdefault(name, _CallStats())
+            stats.latency.observe(seconds)
+            stats.errors += failed
+
+    def _upstream(self, instance: str, method: str, url: str) -> _CallStats:
+        key = (instance, method, _endpoint(url))
+        return self.upstream.get(key) or self.upstream.setdefault(key, _CallStats())
+
+    def record_request(self, instance: str, method: str, url: str, seconds: float,
+                       response: Optional[httpx.Response], error: Optional[BaseException],
+                       streamed: bool = False) -> None:
+        """Record one attempt; the size of a streamed body is added by record_bytes once it is read"""
+        with self._lock:
+            stats = self._upstream(instance, method, url)
+            stats.latency.observe(seconds)
+            if response is not None:
+                stats.statuses[response.status_code] += 1
+                if not streamed:
+                    stats.bytes += len(response.content)
+                stats.errors += response.status_code >= 500
+            else:
+                stats.statuses[type(error).__name__ if error is not None else "Cancelled"] += 1
+                stats.errors += 1
+
+    def record_bytes(self, instance: str, method: str, url: str, size: int) -> None:
+        with self._lock:
+            self._upstream(instance, method, url).bytes += size
+
+    def record_retry(self, instance: str, method: str, url: str) -> None:
+        with self._lock:
+            self._upstream(instance, method, url).retries += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            tools = {
+                name: dict(stats.latency.summary(), errors=stats.errors)
+                for name, stats in sorted(self.tools.items())
+            }
+            upstream = {
+                f"{instance} {method} {endpoint}": dict(
+                    stats.latency.summary(),
+                    errors=stats.errors,
+                    retries=stats.retries,
+                    response_bytes=stats.bytes,
+                    statuses={str(k): v for k, v in stats.statuses.items()}
+                )
+                for (instance, method, endpoint), stats in sorted(self.upstream.items())
+            }
+        return {"uptime_s": round(time.time() - self.started, 1), "tools": tools, "upstream": upstream}
+
+telemetry = Telemetry()
+
+class ToolTelemetry(Middleware):
+    """Times every tool call. A call counts as failed if it raises or returns None or an error dict."""
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = await call_next(context)
+            content = result.structured_content
+            failed = content is None or content == {"result": None} or (
+                isinstance(content, dict) and "error" in content
+            )
+            return result
+        finally:
+            telemetry.record_tool(context.message.name, time.perf_counter() - started, failed)
+
+mcp.add_middleware(ToolTelemetry())
+
+async def _login(controller: "Controller") -> Optional[Dict[str, str]]:
+    """Log in to the AOS server and return request headers carrying the new AuthToken"""
     try:
-        url_login = f'https://{aos_server}/api/user/login'
+        url_login = f'https://{controller.server}/api/user/login'
         headers_init = {'Content-Type': "application/json", 'Cache-Control': "no-cache"}
-        data = {"username": username, "password": password}
-        response = httpx.post(url_login, json=data, headers=headers_init, verify=False)
+        data = {"username": controller.username, "password": controller.password}
+        response = await _send(controller, "POST", url_login, json=data, headers=headers_init, safe_to_resend=True)
         if response.status_code != 201:
             print(f"Authentication failed: {response.status_code} - {response.text}", file=sys.stderr)
             return None
@@ -35,91 +463,1744 @@ def auth(aos_server: str, username: str, password: str) -> Optional[Dict[str, st
         if not auth_token:
             print("No token found in authentication response", file=sys.stderr)
             return None
-        headers = {
+        return {
             'AuthToken': auth_token,
             'Content-Type': "application/json",
             'Cache-Control': "no-cache"
         }
-        _token_cache = headers
-        return headers
+    except CircuitOpenError:
+        raise
     except Exception as e:
         print(f"An unexpected error occurred during authentication: {e}", file=sys.stderr)
         return None
 
-@mcp.tool()
-def get_bp() -> Optional[List[dict]]:
-    """Gets blueprint information"""
+class TokenManager:
+    """
+    Keeps the session token of one controller account valid.
+
+    The token is refreshed in the background once it is older than
+    token_ttl - token_refresh_margin and a new login is forced once it is
+    older than token_ttl. Concurrent callers, whether tasks on one event
+    loop or threads running their own loops, share a single in-flight login.
+    """
+
+    def __init__(self, controller: "Controller"):
+        self.controller = controller
+        self._lock = threading.Lock()
+        self._headers: Optional[Dict[str, str]] = None
+        self._issued_at = 0.0
+        self._login: Optional[concurrent.futures.Future] = None
+        self._login_task: Optional[asyncio.Task] = None
+
+    @property
+    def token_age(self) -> Optional[float]:
+        """Seconds since the current token was issued, or None without a token"""
+        with self._lock:
+            if self._headers is None:
+                return None
+            return time.monotonic() - self._issued_at
+
+    async def get_headers(self) -> Optional[Dict[str, str]]:
+        """Return headers with a valid AuthToken, logging in if needed"""
+        with self._lock:
+            headers = self._headers
+            age = time.monotonic() - self._issued_at
+        if headers is not None and age < token_ttl:
+            if age >= token_ttl - token_refresh_margin:
+                self._start_login()
+            return headers
+        return await asyncio.wrap_future(self._start_login())
+
+    def invalidate(self, headers: Optional[Dict[str, str]]) -> None:
+        """Drop the cached token if it is the one carried by the given headers"""
+        with self._lock:
+            if headers and self._headers and self._headers.get('AuthToken') == headers.get('AuthToken'):
+                self._headers = None
+
+    def _start_login(self) -> concurrent.futures.Future:
+        """
+        Return the in-flight login, starting one if none is running.
+        The login runs as its own task so a cancelled caller does not abort
+        it for everyone else waiting on the same future.
+        """
+        with self._lock:
+            if self._login is not None:
+                return self._login
+            future = self._login = concurrent.futures.Future()
+        task = asyncio.get_running_loop().create_task(_login(self.controller))
+        self._login_task = task
+        task.add_done_callback(lambda t: self._finish_login(t, future))
+        return future
+
+    def _finish_login(self, task: asyncio.Task, future: concurrent.futures.Future) -> None:
+        error = None if task.cancelled() else task.exception()
+        headers = None if task.cancelled() or error else task.result()
+        with self._lock:
+            if headers is not None:
+                self._headers = headers
+                self._issued_at = time.monotonic()
+            self._login = None
+            self._login_task = None
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(headers)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a controller whose circuit breaker is open"""
+
+class CircuitBreaker:
+    """
+    Fails fast while a controller is unhealthy. The circuit opens after
+    breaker_failure_threshold consecutive failures; once breaker_reset_timeout
+    has passed a single trial request is let through, and its outcome closes
+    the circuit again or keeps it open for another period.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_request(self) -> None:
+        """Raise CircuitOpenError unless a request may be sent now"""
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self._opened_at + breaker_reset_timeout - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half-open"
+            if self.state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+        raise CircuitOpenError(
+            f"Apstra instance '{self.name}' is unavailable, retry in {max(remaining, 0):.0f}s"
+        )
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half-open" or self.failures >= breaker_failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release(self) -> None:
+        """Give back a trial slot when the request ended without reaching the controller"""
+        with self._lock:
+            self._trial_in_flight = False
+
+class EventBuffer:
+    """
+    Bounded ring buffer of polled records with increasing sequence numbers.
+    Each poll delivers the full upstream list; only records that are new or
+    changed since the previous poll are appended.
+    """
+
+    def __init__(self, maxsize: int):
+        self.records: deque = deque(maxlen=maxsize)
+        self.seq = 0
+        self.polls = 0
+        self.last_poll: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._seen: set = set()
+        self._lock = threading.Lock()
+
+    def ingest(self, records: List[Any]) -> int:
+        """Append the records not seen in the previous poll; returns how many were new"""
+        fingerprints = [hash(json.dumps(r, sort_keys=True, separators=(',', ':'), default=str)) for r in records]
+        with self._lock:
+            new = 0
+            for record, fingerprint in zip(records, fingerprints):
+                if fingerprint not in self._seen:
+                    self.seq += 1
+                    self.records.append((self.seq, record))
+                    new += 1
+            self._seen = set(fingerprints)
+            self.polls += 1
+            self.last_poll = time.time()
+            self.last_error = None
+            return new
+
+    def since(self, cursor: Optional[str] = None, limit: Optional[int] = None) -> dict:
+        """Records after sequence number `cursor` (all buffered records if None), oldest first"""
+        after = int(cursor) if cursor else 0
+        with self._lock:
+            oldest = self.records[0][0] if self.records else self.seq + 1
+            # Sequence numbers are contiguous, so the start is found by offset, not by scanning
+            start = max(0, after + 1 - oldest)
+            end = len(self.records) if limit is None else min(len(self.records), start + max(limit, 0))
+            page = [dict(record, seq=seq) if isinstance(record, dict) else {"seq": seq, "value": record}
+                    for seq, record in itertools.islice(self.records, start, end)]
+            last = page[-1]["seq"] if page else self.seq if start >= len(self.records) else after
+            return {
+                "items": page,
+                "count": len(page),
+                "cursor": str(last),
+                "more": end < len(self.records),
+                "dropped": max(0, oldest - after - 1) if cursor else 0,
+                "last_poll": self.last_poll,
+                "last_error": self.last_error
+            }
+
+REDACTED = "***"
+
+def _redact(value: Any) -> Any:
+    """Mask the values of redact_keys anywhere in a JSON document"""
+    if isinstance(value, dict):
+        return {k: REDACTED if k.lower() in redact_keys else _redact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_redact(v) for v in value]
+    return value
+
+def _json_body(content: bytes) -> Any:
+    """Decode a request or response body as JSON, falling back to text (None when empty)"""
+    if not content:
+        return None
+    try:
+        return json.loads(content)
+    except ValueError:
+        return content.decode("utf-8", errors="replace")
+
+def _traffic_key(method: str, url: str, body: Any) -> Tuple[str, str, str]:
+    return method, url, json.dumps(body, sort_keys=True, separators=(',', ':'))
+
+def _open_traffic(path: str, mode: str):
+    import gzip  # only needed for compressed traffic logs
+    return gzip.open(path, mode + "t", encoding="utf-8") if path.endswith(".gz") else open(path, mode, encoding="utf-8")
+
+class TrafficLog:
+    """Append-only recording of upstream requests and responses, one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.recorded = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    def write(self, entry: dict) -> None:
+        line = json.dumps(entry, separators=(',', ':')) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = _open_traffic(self.path, "a")
+            self._file.write(line)
+            self._file.flush()
+            self.recorded += 1
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Sends requests through another transport and records each exchange (redacted) to a TrafficLog"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, log: TrafficLog):
+        self.transport = transport
+        self.log = log
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        content = await response.aread()
+        self.log.write({
+            "method": request.method,
+            "url": str(request.url),
+            "body": _redact(_json_body(request.content)),
+            "status": response.status_code,
+            "content_type": response.headers.get("content-type"),
+            "response": _redact(_json_body(content)),
+            "ms": round((time.perf_counter() - started) * 1000, 1)
+        })
+        # The body is already decoded, so it must not be decompressed again by the client
+        headers = [(k, v) for k, v in response.headers.multi_items()
+                   if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")]
+        return httpx.Response(response.status_code, headers=headers, content=content, extensions=response.extensions)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+class Recording:
+    """
+    Responses of a TrafficLog, by (method, url, request body). Repeated requests get
+    the recorded responses in order and the last one once they run out; requests
+    whose body was never seen fall back to any recording of the same method and URL.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.replayed = 0
+        self.missed = 0
+        self.exchanges: Dict[Tuple[str, str, str], deque] = {}
+        self.by_url: Dict[Tuple[str, str], deque] = {}
+        with _open_traffic(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.exchanges.setdefault(_traffic_key(entry["method"], entry["url"], entry["body"]), deque()).append(entry)
+                    self.by_url.setdefault((entry["method"], entry["url"]), deque()).append(entry)
+        self._lock = threading.Lock()
+
+    def next(self, method: str, url: str, body: Any) -> Optional[dict]:
+        with self._lock:
+            queue = self.exchanges.get(_traffic_key(method, url, body)) or self.by_url.get((method, url))
+            if not queue:
+                self.missed += 1
+                return None
+            self.replayed += 1
+            return queue.popleft() if len(queue) > 1 else queue[0]
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Answers requests from a Recording without contacting a controller"""
+
+    def __init__(self, recording: Recording):
+        self.recording = recording
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = _redact(_json_body(request.content))
+        entry = self.recording.next(request.method, str(request.url), body)
+        if entry is None:
+            print(f"No recorded response for {request.method} {request.url}", file=sys.stderr)
+            return httpx.Response(404, json={"errors": "Not in recording"}, request=request)
+        if replay_latency and entry.get("ms"):
+            await asyncio.sleep(entry["ms"] / 1000 * replay_latency)
+        response = entry.get("response")
+        if response is None:
+            content = b""
+        elif isinstance(response, str) and "json" not in (entry.get("content_type") or ""):
+            content = response.encode()
+        else:
+            content = json.dumps(response).encode()
+        headers = {"content-type": entry["content_type"]} if entry.get("content_type") else {}
+        return httpx.Response(entry["status"], headers=headers, content=content, request=request)
+
+_traffic_log: Optional[TrafficLog] = None
+_recording: Optional[Recording] = None
+
+def _traffic_transport(limits: httpx.Limits, use_http2: bool) -> Optional[httpx.AsyncBaseTransport]:
+    """Transport for a new client: replay, recording around http_transport or the network, or http_transport itself"""
+    global _traffic_log, _recording
+    if replay_path:
+        if _recording is None or _recording.path != replay_path:
+            _recording = Recording(replay_path)
+        return ReplayTransport(_recording)
+    if record_path:
+        if _traffic_log is None or _traffic_log.path != record_path:
+            _traffic_log = TrafficLog(record_path)
+        transport = http_transport or httpx.AsyncHTTPTransport(verify=False, http2=use_http2, limits=limits)
+        return RecordingTransport(transport, _traffic_log)
+    return http_transport
+
+class Controller:
+    """
+    One Apstra instance. Every controller has its own connection pool,
+    token manager and cache namespace, so one server can serve several.
+    """
+
+    def __init__(self, name: str, server: str, username: str, password: str):
+        self.name = name
+        self.server = server
+        self.username = username
+        self.password = password
+        self.tokens = TokenManager(self)
+        self.breaker = CircuitBreaker(name)
+        # Identical GETs in flight, shared by every concurrent caller (see _request)
+        self.inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.coalesced_gets = 0
+        self.cache = TTLCache(cache_max_entries)
+        # Latest probed version per blueprint: blueprint_id -> (probed_at, version).
+        # The generation counter is bumped by every invalidation so a probe that was
+        # in flight during one of our own writes does not store the old version.
+        self.blueprint_versions: Dict[str, Tuple[float, Any]] = {}
+        self.blueprint_generations: Dict[str, int] = {}
+        self.blueprint_indexes: Dict[str, "BlueprintIndex"] = {}
+        # VNIs/VLAN IDs handed out by the allocator: blueprint_id -> {(kind, value): released_at},
+        # None while the create is in flight. Kept out of every rebuilt allocator until a
+        # rebuilt index lists them (see _reserve).
+        self.resource_holds: Dict[str, Dict[Tuple[str, int], Optional[float]]] = {}
+        # Graph mirrors by blueprint, least recently used first (see _blueprint_graph)
+        self.blueprint_graphs: "OrderedDict[str, BlueprintGraph]" = OrderedDict()
+        # Template name -> template id, rebuilt whenever the cached template catalog is re-fetched
+        self.template_index: Tuple[Any, Dict[str, str]] = (None, {})
+        # Alert events and metric records gathered by the pollers (see start_pollers)
+        self.alerts = EventBuffer(event_buffer_size)
+        self.metrics = EventBuffer(event_buffer_size)
+        self.polling: set = set()
+        # The client and the concurrency limit belong to the event loop they were
+        # created on and are rebuilt if the server is started on a new loop.
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._limit: Optional[asyncio.Semaphore] = None
+
+    def get_client(self) -> httpx.AsyncClient:
+        """
+        Return the async HTTP client of this controller.
+        Connections are kept alive and reused across tool calls.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is not None and not self._client.is_closed and self._client_loop is loop:
+            return self._client
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        use_http2 = http2 and importlib.util.find_spec("h2") is not None
+        self._client = httpx.AsyncClient(
+            verify=False,
+            http2=use_http2,
+            limits=limits,
+            timeout=request_timeout,
+            transport=_traffic_transport(limits, use_http2)
+        )
+        self._client_loop = loop
+        self._limit = asyncio.Semaphore(max_concurrent_requests)
+        return self._client
+
+    async def close(self) -> None:
+        """Close the HTTP client and release its pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
+        self._limit = None
+
+# Registered controllers by instance name, loaded on first use (see load_controllers)
+_controllers: Optional[Dict[str, Controller]] = None
+_default_instance: Optional[str] = None
+
+def load_controllers() -> Dict[str, Controller]:
+    """
+    Build the controller registry. With APSTRA_CONTROLLERS pointing to a JSON file
+    of the form {"default": "emea", "controllers": {"emea": {"server": ..., "username": ...,
+    "password": ...}, ...}} (or the same keys in the APSTRA_CONFIG file) every entry is
+    registered; otherwise a single "default" controller is built from aos_server,
+    username and password.
+    """
+    global _controllers, _default_instance
+    path = os.environ.get('APSTRA_CONTROLLERS')
+    config = _config_file
+    if path:
+        with open(path) as f:
+            config = json.load(f)
+    if path or config.get("controllers"):
+        entries = config.get("controllers", {})
+        if not entries:
+            raise ValueError(f"No controllers defined in {path}")
+        _controllers = {
+            name: Controller(name, entry["server"], entry["username"], entry["password"])
+            for name, entry in entries.items()
+        }
+        _default_instance = config.get("default") or next(iter(_controllers))
+    else:
+        _controllers = {"default": Controller("default", aos_server, username, password)}
+        _default_instance = "default"
+    return _controllers
+
+def get_controllers() -> Dict[str, Controller]:
+    """Return all registered controllers by instance name"""
+    return _controllers if _controllers is not None else load_controllers()
+
+def get_controller(instance: Optional[str] = None) -> Controller:
+    """Return the controller for an instance name, or the default controller"""
+    controllers = get_controllers()
+    if instance == ALL_INSTANCES:
+        raise ValueError(f"instance='{ALL_INSTANCES}' is not supported by this tool")
+    name = instance or _default_instance
+    if name not in controllers:
+        raise ValueError(f"Unknown Apstra instance '{instance}', known instances: {', '.join(controllers)}")
+    return controllers[name]
+
+async def fan_out(call: Callable[[str], Awaitable[Any]]) -> Dict[str, Any]:
+    """
+    Run call(instance) for every registered controller concurrently and return
+    {instance: result}. A controller that raises reports {"error": ...} instead.
+    """
+    names = list(get_controllers())
+    results = await asyncio.gather(*(call(name) for name in names), return_exceptions=True)
+    return {
+        name: {"error": str(result)} if isinstance(result, Exception) else result
+        for name, result in zip(names, results)
+    }
+
+async def close_controllers() -> None:
+    """Close the connection pools of all controllers and the traffic recording"""
+    if _controllers is not None:
+        for controller in _controllers.values():
+            await controller.close()
+    if _traffic_log is not None:
+        _traffic_log.close()
+
+_timeout_profiles: Optional[List[Tuple[Optional[str], "re.Pattern", float]]] = None
+
+def _timeout_for(method: str, url: str) -> float:
+    """Return the timeout profile matching a request, or request_timeout"""
+    global _timeout_profiles
+    if _timeout_profiles is None:
+        _timeout_profiles = [(m, re.compile(p), t) for m, p, t in timeout_profiles]
+    path = httpx.URL(url).path
+    for profile_method, pattern, timeout in _timeout_profiles:
+        if (profile_method is None or profile_method == method) and pattern.search(path):
+            return timeout
+    return request_timeout
+
+RETRYABLE_STATUS = {502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+def _backoff(attempt: int, response: Optional[httpx.Response] = None) -> float:
+    """Full-jitter exponential backoff, honouring a numeric Retry-After header"""
+    delay = random.uniform(0, min(retry_backoff_max, retry_backoff_base * 2 ** attempt))
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        delay = max(delay, min(float(retry_after), retry_backoff_max))
+    return delay
+
+async def _send(
+    controller: Controller,
+    method: str,
+    url: str,
+    idempotency_check: Optional[Callable[[], Awaitable[Any]]] = None,
+    safe_to_resend: bool = False,
+    stream: bool = False,
+    **kwargs
+) -> httpx.Response:
+    """
+    Send a request through the controller's client, holding one of its
+    concurrency slots for the duration of the call.
+
+    Idempotent methods, and requests sent with safe_to_resend=True (a login,
+    or a POST that only reads), are retried on connection errors, timeouts
+    and 502/503/504. Other writes are retried when the request never reached
+    the controller, or when idempotency_check returns None to confirm the
+    earlier attempt did not take effect; if it returns the existing object
+    instead, that object is returned as the response. A 404 to a DELETE that
+    was resent after an earlier attempt reached the controller means that
+    attempt deleted the resource, and is returned as 204. Every attempt goes
+    through the controller's circuit breaker, which counts connection errors,
+    timeouts and any 5xx response as failures.
+
+    With stream=True the body is not read; the caller must close the response.
+    """
+    kwargs.setdefault("timeout", _timeout_for(method, url))
+    client = controller.get_client()
+    attempt = 0
+    # Whether an earlier attempt may have reached the controller
+    resent = False
+    while True:
+        controller.breaker.before_request()
+        response, error, sent = None, None, True
+        started = time.perf_counter()
+        try:
+            async with controller._limit:
+                started = time.perf_counter()
+                if stream:
+                    response = await client.send(client.build_request(method, url, **kwargs), stream=True)
+                else:
+                    response = await client.request(method, url, **kwargs)
+        except httpx.PoolTimeout as e:
+            controller.breaker.release()
+            error, sent = e, False
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            controller.breaker.record_failure()
+            error, sent = e, False
+        except httpx.TransportError as e:
+            controller.breaker.record_failure()
+            error = e
+        except BaseException:
+            controller.breaker.release()
+            raise
+        finally:
+            telemetry.record_request(controller.name, method, url, time.perf_counter() - started, response, error, stream)
+        if error is None:
+            if response.status_code >= 500:
+                controller.breaker.record_failure()
+            else:
+                controller.breaker.record_success()
+            if response.status_code not in RETRYABLE_STATUS:
+                if method == "DELETE" and resent and response.status_code == 404:
+                    await response.aclose()
+                    return httpx.Response(204, request=response.request)
+                return response
+
+        retry = attempt < max_retries and (not sent or safe_to_resend or method in IDEMPOTENT_METHODS)
+        if attempt < max_retries and not retry and idempotency_check is not None:
+            try:
+                existing = await idempotency_check()
+            except Exception as e:
+                print(f"Idempotency check failed for {method} {url}: {e}", file=sys.stderr)
+            else:
+                if existing is not None:
+                    return httpx.Response(200, json=existing, request=httpx.Request(method, url))
+                retry = True
+        if not retry:
+            if error is not None:
+                raise error
+            return response
+        attempt += 1
+        resent = resent or sent
+        if response is not None:
+            await response.aclose()
+        telemetry.record_retry(controller.name, method, url)
+        await asyncio.sleep(_backoff(attempt, response))
+
+async def auth(controller: Controller) -> Optional[Dict[str, str]]:
+    """
+    Authenticate with the AOS server and return headers with AuthToken.
+    The token is reused until it nears expiry (see TokenManager).
+    """
+    return await controller.tokens.get_headers()
+
+async def _request(controller: Controller, method: str, url: str, headers: Dict[str, str], **kwargs) -> httpx.Response:
+    """
+    Send an authenticated request to the controller (see _send for retries).
+
+    Identical plain GETs (same controller, user and URL) that are already in
+    flight are not sent again: every caller waits on the one upstream request.
+    """
+    if method != "GET" or kwargs:
+        return await _send_authenticated(controller, method, url, headers, **kwargs)
+    key = (controller.username, url)
+    task = controller.inflight.get(key)
+    if task is not None and task.get_loop() is asyncio.get_running_loop():
+        controller.coalesced_gets += 1
+    else:
+        task = asyncio.get_running_loop().create_task(_send_authenticated(controller, method, url, headers))
+        controller.inflight[key] = task
+        task.add_done_callback(lambda t: _finish_inflight(controller, key, t))
+    # Shielded so a cancelled caller does not cancel the request for the others
+    return await asyncio.shield(task)
+
+def _finish_inflight(controller: Controller, key: Tuple[str, str], task: asyncio.Task) -> None:
+    if controller.inflight.get(key) is task:
+        del controller.inflight[key]
+    if not task.cancelled():
+        task.exception()  # mark retrieved even if every caller was cancelled
+
+async def _send_authenticated(controller: Controller, method: str, url: str, headers: Dict[str, str], **kwargs) -> httpx.Response:
+    """
+    Send a request with the given auth headers. If the token is rejected with
+    a 401, log in once more and replay the request with the new token.
+    """
+    response = await _send(controller, method, url, headers=headers, **kwargs)
+    if response.status_code == 401:
+        controller.tokens.invalidate(headers)
+        fresh = await controller.tokens.get_headers()
+        if fresh:
+            await response.aclose()
+            response = await _send(controller, method, url, headers=fresh, **kwargs)
+    return response
+
+def _json(response: httpx.Response) -> Any:
+    """Decode a JSON response body with the fastest available backend (see _json_loads)"""
+    try:
+        return _json_loads(response.content)
+    except ValueError:
+        return response.json()
+
+async def _cached_get(controller: Controller, url: str, headers: Dict[str, str], ttl: float, refresh: bool = False) -> Any:
+    """
+    GET a JSON document, serving it from the controller's cache for up to ttl seconds.
+    With refresh=True the cache is bypassed and the entry replaced.
+    """
+    if not refresh:
+        data = controller.cache.get(url)
+        if data is not _MISSING:
+            return data
+    response = await _request(controller, "GET", url, headers=headers)
+    response.raise_for_status()
+    data = _json(response)
+    controller.cache.set(url, data, ttl)
+    return data
+
+def _is_blueprint_key(key: Hashable, blueprint_id: str) -> bool:
+    return isinstance(key, tuple) and key[:2] == ('blueprint', blueprint_id)
+
+async def _blueprint_version(controller: Controller, blueprint_id: str, headers: Dict[str, str]) -> Any:
+    """Return the current staging version of a blueprint, probing diff-status if needed"""
+    probed = controller.blueprint_versions.get(blueprint_id)
+    if probed is not None and time.monotonic() - probed[0] < blueprint_version_probe_ttl:
+        return probed[1]
+    generation = controller.blueprint_generations.get(blueprint_id, 0)
+    url = f'https://{controller.server}/api/blueprints/{blueprint_id}/diff-status'
+    response = await _request(controller, "GET", url, headers=headers)
+    response.raise_for_status()
+    version = response.json().get('staging_version')
+    if controller.blueprint_generations.get(blueprint_id, 0) == generation:
+        controller.blueprint_versions[blueprint_id] = (time.monotonic(), version)
+        if probed is not None and probed[1] != version:
+            controller.cache.clear(lambda k: _is_blueprint_key(k, blueprint_id) and k[2] != version)
+    return version
+
+def invalidate_blueprint_list(controller: Controller) -> None:
+    """Forget the cached blueprint list after a blueprint was created or deleted"""
+    url = f'https://{controller.server}/api/blueprints'
+    controller.cache.clear(lambda k: k == url)
+
+def invalidate_blueprint(controller: Controller, blueprint_id: str) -> None:
+    """Forget every cached read and the known version of a blueprint after a write"""
+    controller.blueprint_generations[blueprint_id] = controller.blueprint_generations.get(blueprint_id, 0) + 1
+    controller.blueprint_versions.pop(blueprint_id, None)
+    controller.cache.clear(lambda k: _is_blueprint_key(k, blueprint_id))
+
+async def _blueprint_get(
+    controller: Controller,
+    blueprint_id: str,
+    url: str,
+    headers: Dict[str, str],
+    refresh: bool = False
+) -> Any:
+    """
+    GET a per-blueprint JSON document, cached under (blueprint_id, version).
+    A cached copy is served for as long as the blueprint version is unchanged.
+    """
+    if refresh:
+        invalidate_blueprint(controller, blueprint_id)
+    version = await _blueprint_version(controller, blueprint_id, headers)
+    key = ('blueprint', blueprint_id, version, url)
+    if version is not None:
+        data = controller.cache.get(key)
+        if data is not _MISSING:
+            return data
+    response = await _request(controller, "GET", url, headers=headers)
+    response.raise_for_status()
+    data = _json(response)
+    if version is not None:
+        controller.cache.set(key, data, blueprint_cache_ttl)
+    return data
+
+def _items(data: Any, key: str = 'items') -> Dict[str, dict]:
+    """Normalize an Apstra collection (dict keyed by id, or list) to a dict keyed by id"""
+    items = data.get(key, {}) if isinstance(data, dict) else data
+    if isinstance(items, list):
+        return {item.get('id', idx): item for idx, item in enumerate(items)}
+    return items if isinstance(items, dict) else {}
+
+def _as_int(value: Any) -> Optional[int]:
+    """VNIs come back as strings on some endpoints; None for anything that is not a number"""
+    try:
+        return int(value) if value is not None and not isinstance(value, bool) else None
+    except (TypeError, ValueError):
+        return None
+
+class IntervalSet:
+    """
+    Set of free integers stored as sorted, disjoint [start, end] ranges.
+    Membership, take and release locate their range by binary search.
+    """
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self, ranges: List[Tuple[int, int]], used: Optional[set] = None):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        for first, last in sorted(ranges):
+            if first > last:
+                continue
+            if self.ends and first <= self.ends[-1] + 1:
+                self.ends[-1] = max(self.ends[-1], last)
+            else:
+                self.starts.append(first)
+                self.ends.append(last)
+        for value in sorted(used or ()):
+            self.take(value)
+
+    def _find(self, value: int) -> int:
+        index = bisect.bisect_right(self.starts, value) - 1
+        return index if index >= 0 and value <= self.ends[index] else -1
+
+    def __contains__(self, value: int) -> bool:
+        return self._find(value) >= 0
+
+    def __len__(self) -> int:
+        return sum(end - start + 1 for start, end in zip(self.starts, self.ends))
+
+    def first(self) -> Optional[int]:
+        return self.starts[0] if self.starts else None
+
+    def take(self, value: int) -> bool:
+        """Remove value from the set; False if it was not free"""
+        index = self._find(value)
+        if index < 0:
+            return False
+        start, end = self.starts[index], self.ends[index]
+        if start == end:
+            del self.starts[index], self.ends[index]
+        elif value == start:
+            self.starts[index] = value + 1
+        elif value == end:
+            self.ends[index] = value - 1
+        else:
+            self.ends[index] = value - 1
+            self.starts.insert(index + 1, value + 1)
+            self.ends.insert(index + 1, end)
+        return True
+
+    def release(self, value: int) -> None:
+        """Put value back, merging it with adjacent ranges"""
+        index = bisect.bisect_right(self.starts, value)
+        if index > 0 and value <= self.ends[index - 1]:
+            return
+        joins_left = index > 0 and self.ends[index - 1] == value - 1
+        joins_right = index < len(self.starts) and self.starts[index] == value + 1
+        if joins_left and joins_right:
+            self.ends[index - 1] = self.ends[index]
+            del self.starts[index], self.ends[index]
+        elif joins_left:
+            self.ends[index - 1] = value
+        elif joins_right:
+            self.starts[index] = value
+        else:
+            self.starts.insert(index, value)
+            self.ends.insert(index, value)
+
+class ResourceAllocator:
+    """Free VNIs (from the VNI pools) and VLAN IDs of one blueprint"""
+    __slots__ = ('free',)
+
+    def __init__(self, vni_ranges: List[Tuple[int, int]], used_vnis: set, used_vlans: set):
+        self.free = {
+            "vni": IntervalSet(vni_ranges or [vni_range], used_vnis),
+            "vlan": IntervalSet([vlan_range], used_vlans),
+        }
+
+    def take(self, kind: str, value: int) -> bool:
+        return self.free[kind].take(value)
+
+    def release(self, kind: str, value: int) -> None:
+        self.free[kind].release(value)
+
+    def allocate(self, kind: str) -> int:
+        value = self.free[kind].first()
+        if value is None:
+            raise ValueError(f"No free {kind.upper()} left")
+        self.free[kind].take(value)
+        return value
+
+class BlueprintIndex:
+    """
+    Name to ID lookups for one blueprint: virtual networks by (label, security_zone_id)
+    and security zones by label.
+
+    The index matches blueprint `version`. Our own successful writes are applied
+    as deltas and counted in `pending_writes`; when the next version probe equals
+    version + pending_writes, no one else changed the blueprint and the index is
+    confirmed without downloading the listings again.
+    """
+    __slots__ = ('version', 'pending_writes', 'vn_ids', 'vn_keys', 'sz_ids', 'sz_labels',
+                 'used_vnis', 'used_vlans', 'vn_resources', 'allocator')
+
+    def __init__(self, version: Any, vns: Any, zones: Any):
+        self.version = version
+        self.pending_writes = 0
+        self.vn_ids: Dict[Tuple[str, str], str] = {}
+        self.vn_keys: Dict[str, Tuple[str, str]] = {}
+        self.sz_ids: Dict[str, str] = {}
+        self.sz_labels: Dict[str, str] = {}
+        # VNIs and VLAN IDs in use (counted, a VLAN ID may be shared), the (vni, vlan_id)
+        # of every VN so deletes can free them, and the allocator built on first use
+        self.used_vnis: Counter = Counter()
+        self.used_vlans: Counter = Counter()
+        self.vn_resources: Dict[str, Tuple[Optional[int], Optional[int]]] = {}
+        self.allocator: Optional[ResourceAllocator] = None
+        for vn_id, vn in _items(vns, 'virtual_networks').items():
+            self.add_vn(vn.get('id', vn_id), vn.get('label'), vn.get('security_zone_id'), vn.get('vn_id'), vn.get('vlan_id'))
+        for sz_id, sz in _items(zones).items():
+            self.add_security_zone(sz.get('id', sz_id), sz.get('label'), sz.get('vlan_id'), sz.get('vni_id'))
+
+    def is_current(self, version: Any) -> bool:
+        return isinstance(version, int) and isinstance(self.version, int) \
+            and self.version + self.pending_writes == version
+
+    def _use(self, vni: Optional[int], vlan_id: Optional[int]) -> None:
+        for used, kind, value in ((self.used_vnis, "vni", vni), (self.used_vlans, "vlan", vlan_id)):
+            if value is not None:
+                used[value] += 1
+                if self.allocator is not None:
+                    self.allocator.take(kind, value)
+
+    def _unuse(self, vni: Optional[int], vlan_id: Optional[int]) -> None:
+        for used, kind, value in ((self.used_vnis, "vni", vni), (self.used_vlans, "vlan", vlan_id)):
+            if value is not None and used[value] > 0:
+                used[value] -= 1
+                if not used[value]:
+                    del used[value]
+                    if self.allocator is not None:
+                        self.allocator.release(kind, value)
+
+    def add_vn(self, vn_id: str, label: str, security_zone_id: str, vni: Any = None, vlan_id: Any = None) -> None:
+        self.vn_ids.setdefault((label, security_zone_id), vn_id)
+        self.vn_keys[vn_id] = (label, security_zone_id)
+        resources = self.vn_resources[vn_id] = (_as_int(vni), _as_int(vlan_id))
+        self._use(*resources)
+
+    def remove_vns(self, vn_ids: List[str]) -> None:
+        for vn_id in vn_ids:
+            key = self.vn_keys.pop(vn_id, None)
+            if key is not None and self.vn_ids.get(key) == vn_id:
+                del self.vn_ids[key]
+            resources = self.vn_resources.pop(vn_id, None)
+            if resources is not None:
+                self._unuse(*resources)
+
+    def add_security_zone(self, sz_id: str, label: str, vlan_id: Any = None, vni: Any = None) -> None:
+        self.sz_ids.setdefault(label, sz_id)
+        self.sz_labels[sz_id] = label
+        self._use(_as_int(vni), _as_int(vlan_id))
+
+    def security_zone_id(self, label_or_id: str) -> str:
+        """Accept either a security zone ID or its label and return the ID"""
+        if label_or_id in self.sz_labels:
+            return label_or_id
+        return self.sz_ids.get(label_or_id, label_or_id)
+
+async def _blueprint_index(controller: Controller, blueprint_id: str, headers: Dict[str, str]) -> BlueprintIndex:
+    """Return the name index of a blueprint, rebuilding it only when someone else changed the blueprint"""
+    version = await _blueprint_version(controller, blueprint_id, headers)
+    index = controller.blueprint_indexes.get(blueprint_id)
+    if index is not None and index.is_current(version):
+        index.version, index.pending_writes = version, 0
+        return index
+    base_url = f'https://{controller.server}/api/blueprints/{blueprint_id}'
+    vns, zones = await asyncio.gather(
+        _blueprint_get(controller, blueprint_id, f'{base_url}/virtual-networks', headers),
+        _blueprint_get(controller, blueprint_id, f'{base_url}/security-zones', headers)
+    )
+    index = controller.blueprint_indexes[blueprint_id] = BlueprintIndex(version, vns, zones)
+    return index
+
+def _index_write(controller: Controller, blueprint_id: str, apply: Callable[[BlueprintIndex], None]) -> None:
+    """Apply one of our own successful writes to the blueprint index, if there is one"""
+    index = controller.blueprint_indexes.get(blueprint_id)
+    if index is not None:
+        apply(index)
+        index.pending_writes += 1
+
+async def _vni_ranges(controller: Controller, headers: Dict[str, str]) -> List[Tuple[int, int]]:
+    url = f'https://{controller.server}/api/resources/vni-pools'
+    pools = await _cached_get(controller, url, headers, catalog_cache_ttl['/api/resources/vni-pools'])
+    return [
+        (int(r['first']), int(r['last']))
+        for pool in (pools or {}).get('items') or [] for r in pool.get('ranges') or []
+    ]
+
+async def _reserve(
+    controller: Controller, blueprint_id: str, headers: Dict[str, str], wanted: Dict[str, Optional[int]]
+) -> Dict[str, int]:
+    """
+    Reserve one value per kind ("vni"/"vlan"): the given value after checking that it is not
+    in use, or the lowest free one for None. Raises ValueError on a conflict.
+    Pair every successful call with _release.
+    """
+    await _blueprint_index(controller, blueprint_id, headers)
+    ranges = await _vni_ranges(controller, headers)
+    # No awaits from here on: every caller allocates from the latest index's allocator
+    index = controller.blueprint_indexes[blueprint_id]
+    holds = controller.resource_holds.setdefault(blueprint_id, {})
+    used = {"vni": index.used_vnis, "vlan": index.used_vlans}
+    if index.allocator is None:
+        expired = time.monotonic() - resource_hold_ttl
+        for (kind, value), released_at in list(holds.items()):
+            if released_at is not None and (value in used[kind] or released_at < expired):
+                del holds[(kind, value)]
+        index.allocator = ResourceAllocator(
+            ranges,
+            set(index.used_vnis) | {v for kind, v in holds if kind == "vni"},
+            set(index.used_vlans) | {v for kind, v in holds if kind == "vlan"}
+        )
+    for kind, value in wanted.items():
+        if value is not None and (value in used[kind] or (kind, value) in holds):
+            raise ValueError(f"{kind.upper()} {value} is already in use in blueprint {blueprint_id}")
+    reserved = {}
+    for kind, value in wanted.items():
+        if value is None:
+            value = index.allocator.allocate(kind)
+        else:
+            index.allocator.take(kind, value)
+        holds[(kind, value)] = None
+        reserved[kind] = value
+    return reserved
+
+def _release(controller: Controller, blueprint_id: str, reserved: Dict[str, int], created: bool) -> None:
+    """
+    Finish the holds of a create. Created values stay held until a rebuilt index lists them
+    (or resource_hold_ttl passes); values of a failed create go back to the current allocator.
+    """
+    holds = controller.resource_holds.get(blueprint_id, {})
+    index = controller.blueprint_indexes.get(blueprint_id)
+    for kind, value in reserved.items():
+        if created:
+            holds[(kind, value)] = time.monotonic()
+            continue
+        holds.pop((kind, value), None)
+        if index is not None and index.allocator is not None:
+            index.allocator.release(kind, value)
+
+class GraphNode:
+    """One blueprint graph node; type, label and role are interned, other scalar properties kept in props"""
+    __slots__ = ('id', 'type', 'label', 'role', 'props', 'out_edges', 'in_edges')
+
+    def __init__(self, node_id: str, node: dict):
+        self.id = node_id
+        self.type = sys.intern(str(node.get('type')))
+        self.label = node.get('label')
+        self.role = sys.intern(node['role']) if isinstance(node.get('role'), str) else None
+        self.props = {
+            k: v for k, v in node.items()
+            if k not in ('id', 'type', 'label', 'role') and v is not None and not isinstance(v, (dict, list))
+        }
+        # (relationship type, neighbour id) pairs
+        self.out_edges: List[Tuple[str, str]] = []
+        self.in_edges: List[Tuple[str, str]] = []
+
+    def as_dict(self) -> dict:
+        return dict(self.props, id=self.id, type=self.type, label=self.label, role=self.role)
+
+class BlueprintGraph:
+    """
+    Read-only mirror of a blueprint's node/relationship graph at one version,
+    with adjacency lists and secondary indexes by type, label and role.
+    """
+    __slots__ = ('version', 'nodes', 'by_type', 'by_label', 'by_role', 'relationships')
+
+    def __init__(self, version: Any, nodes: Any, relationships: Any):
+        self.version = version
+        self.nodes: Dict[str, GraphNode] = {}
+        self.by_type: Dict[str, List[str]] = {}
+        self.by_label: Dict[str, List[str]] = {}
+        self.by_role: Dict[str, List[str]] = {}
+        self.relationships = 0
+        for node_id, node in _items(nodes, 'nodes').items():
+            graph_node = self.nodes[node.get('id', node_id)] = GraphNode(node.get('id', node_id), node)
+            self.by_type.setdefault(graph_node.type, []).append(graph_node.id)
+            if graph_node.label is not None:
+                self.by_label.setdefault(graph_node.label, []).append(graph_node.id)
+            if graph_node.role is not None:
+                self.by_role.setdefault(graph_node.role, []).append(graph_node.id)
+        for relationship in _items(relationships, 'relationships').values():
+            source = self.nodes.get(relationship.get('source_id'))
+            target = self.nodes.get(relationship.get('target_id'))
+            if source is None or target is None:
+                continue
+            rel_type = sys.intern(str(relationship.get('type')))
+            source.out_edges.append((rel_type, target.id))
+            target.in_edges.append((rel_type, source.id))
+            self.relationships += 1
+
+    def find(self, type: Optional[str] = None, label: Optional[str] = None, role: Optional[str] = None) -> List[GraphNode]:
+        """Nodes matching every given attribute, starting from the most selective index"""
+        candidates = [
+            index.get(value, []) for index, value in
+            ((self.by_label, label), (self.by_type, type), (self.by_role, role)) if value is not None
+        ]
+        if not candidates:
+            return list(self.nodes.values())
+        matches = []
+        for node_id in min(candidates, key=len):
+            node = self.nodes[node_id]
+            if (type is None or node.type == type) and (label is None or node.label == label) \
+                    and (role is None or node.role == role):
+                matches.append(node)
+        return matches
+
+    def resolve(self, id_or_label: str, type: Optional[str] = None) -> List[GraphNode]:
+        """Nodes with this ID, or else with this label (optionally of one type)"""
+        node = self.nodes.get(id_or_label)
+        if node is not None and (type is None or node.type == type):
+            return [node]
+        return self.find(type=type, label=id_or_label)
+
+    def neighbors(self, node_ids: List[str], direction: str = "out", relationship: Optional[str] = None,
+                  type: Optional[str] = None, role: Optional[str] = None) -> List[GraphNode]:
+        """Distinct neighbours of the given nodes over matching relationships"""
+        seen, result = set(), []
+        for node_id in node_ids:
+            node = self.nodes[node_id]
+            edges = node.out_edges if direction == "out" else node.in_edges if direction == "in" \
+                else node.out_edges + node.in_edges
+            for rel_type, other_id in edges:
+                if other_id in seen or (relationship is not None and rel_type != relationship):
+                    continue
+                other = self.nodes[other_id]
+                if (type is None or other.type == type) and (role is None or other.role == role):
+                    seen.add(other_id)
+                    result.append(other)
+        return result
+
+    def walk(self, node_ids: List[str], hops: List[Tuple[str, Optional[str], Optional[str]]]) -> List[GraphNode]:
+        """Follow (direction, relationship, node type) hops from the given nodes"""
+        nodes: List[GraphNode] = [self.nodes[node_id] for node_id in node_ids]
+        for direction, relationship, type in hops:
+            nodes = self.neighbors([n.id for n in nodes], direction, relationship, type)
+        return nodes
+
+async def _blueprint_graph(controller: Controller, blueprint_id: str, headers: Dict[str, str],
+                           refresh: bool = False) -> BlueprintGraph:
+    """Return the graph mirror of a blueprint, rebuilding it only when the blueprint version changed"""
+    if refresh:
+        invalidate_blueprint(controller, blueprint_id)
+    version = await _blueprint_version(controller, blueprint_id, headers)
+    graph = controller.blueprint_graphs.get(blueprint_id)
+    if graph is not None and version is not None and graph.version == version:
+        controller.blueprint_graphs.move_to_end(blueprint_id)
+        return graph
+    # Fetched directly rather than through the response cache: the graph is the cached form
+    base_url = f'https://{controller.server}/api/blueprints/{blueprint_id}'
+    nodes, relationships = await asyncio.gather(
+        _request(controller, "GET", f'{base_url}/nodes', headers=headers),
+        _request(controller, "GET", f'{base_url}/relationships', headers=headers)
+    )
+    nodes.raise_for_status()
+    relationships.raise_for_status()
+    graph = BlueprintGraph(version, _json(nodes), _json(relationships))
+    controller.blueprint_graphs[blueprint_id] = graph
+    controller.blueprint_graphs.move_to_end(blueprint_id)
+    while len(controller.blueprint_graphs) > graph_max_blueprints:
+        controller.blueprint_graphs.popitem(last=False)
+    return graph
+
+# Graph query engine (QE) support for query_blueprint
+
+_QE_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def _qe_identifier(value: Any, what: str) -> str:
+    if not isinstance(value, str) or not _QE_IDENTIFIER.match(value):
+        raise ValueError(f"Invalid {what} {value!r}: expected a plain identifier")
+    return value
+
+def _qe_literal(value: Any) -> str:
+    """Render a filter value as a QE literal; a list matches any of its values"""
+    if isinstance(value, list):
+        return f"is_in([{', '.join(_qe_literal(v) for v in value)}])"
+    if value is None or isinstance(value, (bool, int, float)):
+        return repr(value)
+    if isinstance(value, str):
+        return json.dumps(value)
+    raise ValueError(f"Unsupported filter value {value!r}")
+
+def _qe_step(step: Dict[str, Any]) -> str:
+    """
+    One path step: {"node": type, "name": alias, <property>: value, ...} or an
+    edge {"out"|"in": relationship type, "name": alias}
+    """
+    if not isinstance(step, dict):
+        raise ValueError(f"Invalid path step {step!r}")
+    edge = [direction for direction in ("out", "in") if direction in step]
+    kind = edge[0] if edge else "node"
+    if kind == "node" and "node" not in step:
+        raise ValueError(f"Path step needs 'node', 'out' or 'in': {step!r}")
+    args = []
+    if step[kind] is not None:
+        args.append(json.dumps(_qe_identifier(step[kind], f"{kind} type")))
+    for key, value in step.items():
+        if key != kind:
+            args.append(f"{_qe_identifier(key, 'property')}={_qe_literal(value)}")
+    method = "in_" if kind == "in" else kind
+    return f"{method}({', '.join(args)})"
+
+@functools.lru_cache(maxsize=compiled_query_cache_size)
+def _compile_query(spec: str) -> str:
+    """
+    Translate a canonical JSON match spec {"match": [[step, ...], ...], "distinct": [alias, ...]}
+    into a QE query string. Cached, so repeated specs skip translation.
+    """
+    parsed = json.loads(spec)
+    paths = parsed.get("match")
+    if not paths or not isinstance(paths, list) or not all(isinstance(p, list) and p for p in paths):
+        raise ValueError("match must be a non-empty list of non-empty paths")
+    rendered = []
+    for path in paths:
+        if "node" not in path[0]:
+            raise ValueError("Every path must start with a node step")
+        rendered.append(".".join(_qe_step(step) for step in path))
+    query = f"match({', '.join(rendered)})"
+    if parsed.get("distinct"):
+        aliases = ", ".join(json.dumps(_qe_identifier(a, "alias")) for a in parsed["distinct"])
+        query += f".distinct([{aliases}])"
+    return query
+
+async def _blueprint_query(controller: Controller, blueprint_id: str, query: str,
+                           headers: Dict[str, str], refresh: bool = False) -> Any:
+    """Run a QE query against a blueprint, cached under the blueprint version like _blueprint_get"""
+    if refresh:
+        invalidate_blueprint(controller, blueprint_id)
+    version = await _blueprint_version(controller, blueprint_id, headers)
+    key = ('blueprint', blueprint_id, version, 'qe', query)
+    if version is not None:
+        data = controller.cache.get(key)
+        if data is not _MISSING:
+            return data
+    url = f'https://{controller.server}/api/blueprints/{blueprint_id}/qe'
+    # A QE query only reads, so the POST can be resent like a GET
+    response = await _request(controller, "POST", url, json={"query": query}, headers=headers, safe_to_resend=True)
+    response.raise_for_status()
+    data = _json(response)
+    if version is not None:
+        controller.cache.set(key, data, blueprint_cache_ttl)
+    return data
+
+def _template_ids(controller: Controller, templates_data: Any) -> Dict[str, str]:
+    """Return the template name index for a template catalog response"""
+    if controller.template_index[0] is not templates_data:
+        index: Dict[str, str] = {}
+        for template_id, template in _items(templates_data).items():
+            name = template.get("display_name") or template.get("label") or template.get("name")
+            index.setdefault(name, template_id)
+        controller.template_index = (templates_data, index)
+    return controller.template_index[1]
+
+def _field(item: Any, path: str) -> Any:
+    """Read a possibly dotted field path (e.g. 'status.state') from an item"""
+    for part in path.split('.'):
+        if not isinstance(item, dict):
+            return None
+        item = item.get(part)
+    return item
+
+def _matches(item: dict, filter: Dict[str, Any]) -> bool:
+    """True if every filter field equals the given value, or is one of the values of a list"""
+    for path, expected in filter.items():
+        value = _field(item, path)
+        if isinstance(expected, list) and not isinstance(value, list):
+            if value not in expected:
+                return False
+        elif value != expected:
+            return False
+    return True
+
+class _Pager:
+    """
+    Collects one page of items fed one at a time: filtered, projected, and
+    cut at limit or at max_response_bytes. Items past the page are only counted.
+    """
+    __slots__ = ('fields', 'filter', 'start', 'end', 'items', 'size', 'total', 'full', 'truncated')
+
+    def __init__(self, fields: Optional[List[str]], filter: Optional[Dict[str, Any]],
+                 limit: Optional[int], cursor: Optional[str]):
+        self.fields = fields
+        self.filter = filter
+        self.start = int(cursor) if cursor else 0
+        self.end = None if limit is None else self.start + max(limit, 0)
+        self.items: List[Any] = []
+        self.size = 2
+        self.total = 0
+        self.full = False
+        self.truncated = False
+
+    def add(self, item: Any) -> None:
+        if self.filter and not _matches(item, self.filter):
+            return
+        index = self.total
+        self.total += 1
+        if self.full or index < self.start:
+            return
+        if self.end is not None and index >= self.end:
+            self.full = True
+            return
+        if self.fields:
+            item = {path: _field(item, path) for path in self.fields}
+        item_size = len(json.dumps(item, separators=(',', ':'), default=str)) + 1
+        if self.items and self.size + item_size > max_response_bytes:
+            self.full = self.truncated = True
+            return
+        self.items.append(item)
+        self.size += item_size
+
+    def page(self) -> dict:
+        next_index = self.start + len(self.items)
+        return {
+            "items": self.items,
+            "count": len(self.items),
+            "total": self.total,
+            "next_cursor": str(next_index) if next_index < self.total else None,
+            "truncated": self.truncated
+        }
+
+def _page(
+    items: List[dict],
+    fields: Optional[List[str]] = None,
+    filter: Optional[Dict[str, Any]] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
+) -> dict:
+    """
+    Filter, project and page a list of items. The page stops early once it
+    reaches max_response_bytes; next_cursor is set whenever items remain.
+    """
+    pager = _Pager(fields, filter, limit, cursor)
+    for item in items:
+        pager.add(item)
+    return pager.page()
+
+def _paged(
+    data: Any,
+    items: Any,
+    fields: Optional[List[str]],
+    filter: Optional[Dict[str, Any]],
+    limit: Optional[int],
+    cursor: Optional[str]
+) -> Any:
+    """
+    Return data unchanged when no paging argument was given and its items fit
+    in max_response_bytes, otherwise one page of the items (see _page).
+    """
+    if not isinstance(items, list):
+        return data
+    page = _page(items, fields, filter, limit, cursor)
+    if fields is None and filter is None and limit is None and cursor is None and page["next_cursor"] is None:
+        return data
+    return page
+
+class JSONItemStream:
+    """
+    Incremental parser for a JSON document holding one large array: an object
+    such as {"items": [...], ...} or a bare array. Array elements are decoded as
+    chunks arrive and handed out one by one, so the document is never held in
+    memory as a whole; the object's other members are collected in `rest`.
+    """
+    _decoder = json.JSONDecoder()
+    _whitespace = re.compile(r'[ \t\n\r]*')
+    _number = re.compile(r'-?[0-9.eE+-]*')
+
+    # Parser states: what comes next in the document
+    START, KEY, COLON, VALUE, AFTER_VALUE, FIRST_ELEMENT, ELEMENT, AFTER_ELEMENT, DONE = range(9)
+    _expected = {START: '{[', KEY: '}', COLON: ':', AFTER_VALUE: ',}', FIRST_ELEMENT: ']', AFTER_ELEMENT: ',]'}
+
+    def __init__(self, chunks: AsyncIterator[bytes], key: str = 'items'):
+        self.key = key
+        self.rest: Dict[str, Any] = {}
+        self.found = False
+        self.bytes = 0
+        self._chunks = chunks
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._state = self.START
+        self._bare_array = False
+        self._name: Optional[str] = None
+        self._retry_at = 0  # buffer length needed before an incomplete value is decoded again
+
+    def _decode(self, final: bool) -> Tuple[bool, Any]:
+        """Decode the value at the current position; (False, None) if it is not complete yet"""
+        buffer, pos = self._buffer, self._pos
+        if not final and len(buffer) < self._retry_at:
+            return False, None
+        try:
+            value, end = self._decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            # Wait until the unparsed text has doubled, so a value spanning many
+            # chunks is re-scanned only a logarithmic number of times
+            self._retry_at = len(buffer) + (len(buffer) - pos)
+            return False, None
+        if not final and isinstance(value, (int, float)) and self._number.match(buffer, end).end() == len(buffer):
+            return False, None  # the number may go on in the next chunk
+        self._pos = end
+        self._retry_at = 0
+        return True, value
+
+    def _elements(self, buffer: str, elements: List[Any], final: bool) -> bool:
+        """
+        Fast path through the body of the array: decode elements and their separators
+        until the closing bracket (True) or until more text is needed (False).
+        An element counts as complete only once the separator after it is buffered.
+        """
+        if not final and len(buffer) < self._retry_at:
+            return False
+        decode, skip = self._decoder.raw_decode, self._whitespace.match
+        pos, end_of_buffer = self._pos, len(buffer)
+        while True:
+            try:
+                value, end = decode(buffer, pos)
+                after = skip(buffer, end).end()
+                separator = buffer[after] if after < end_of_buffer else None
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                # Wait until the unparsed text has doubled, so an element spanning
+                # many chunks is re-scanned only a logarithmic number of times
+                self._retry_at = end_of_buffer + (end_of_buffer - pos)
+                separator = None
+            if separator == ',':
+                elements.append(value)
+                pos = skip(buffer, after + 1).end()
+                continue
+            self._pos, self._state = pos, self.ELEMENT
+            if separator == ']':
+                elements.append(value)
+                self._pos = after + 1
+                self._state = self.DONE if self._bare_array else self.AFTER_VALUE
+                self._retry_at = 0
+                return True
+            if separator is not None and (final or not isinstance(value, (int, float))
+                                          or self._number.match(buffer, end).end() < end_of_buffer):
+                raise ValueError(f"Invalid JSON: unexpected {separator!r} near byte {self.bytes}")
+            if final:
+                raise ValueError("Invalid JSON: unexpected end of document")
+            return False
+
+    def _parse(self, final: bool) -> List[Any]:
+        """Advance through the buffered text and return the array elements completed by it"""
+        elements = []
+        buffer = self._buffer
+        while self._state != self.DONE:
+            self._pos = self._whitespace.match(buffer, self._pos).end()
+            if self._pos >= len(buffer):
+                if final:
+                    raise ValueError("Invalid JSON: unexpected end of document")
+                break
+            char, state = buffer[self._pos], self._state
+            if state in (self.ELEMENT, self.FIRST_ELEMENT) and not (state == self.FIRST_ELEMENT and char == ']'):
+                if not self._elements(buffer, elements, final):
+                    break
+                continue
+            if state == self.VALUE:
+                if self._name == self.key and not self.found and char == '[':
+                    self._pos += 1
+                    self.found = True
+                    self._state = self.FIRST_ELEMENT
+                    continue
+                complete, value = self._decode(final)
+                if not complete:
+                    break
+                self.rest[self._name] = value
+                self._state = self.AFTER_VALUE
+                continue
+            if state == self.KEY and char == '"':
+                complete, value = self._decode(final)
+                if not complete:
+                    break
+                self._name = value
+                self._state = self.COLON
+                continue
+            if char not in self._expected[state]:
+                raise ValueError(f"Invalid JSON: unexpected {char!r} near byte {self.bytes}")
+            self._pos += 1
+            if state == self.START:
+                self._bare_array = self.found = char == '['
+                self._state = self.FIRST_ELEMENT if self._bare_array else self.KEY
+            elif char == ':':
+                self._state = self.VALUE
+            elif char == ',':
+                self._state = self.ELEMENT if state == self.AFTER_ELEMENT else self.KEY
+            elif char == ']':
+                self._state = self.DONE if self._bare_array else self.AFTER_VALUE
+            else:
+                self._state = self.DONE
+        return elements
+
+    async def items(self) -> AsyncIterator[Any]:
+        """Yield the elements of the array; `rest` is complete once this is exhausted"""
+        async for chunk in self._chunks:
+            self.bytes += len(chunk)
+            self._buffer = self._buffer[self._pos:] + self._text.decode(chunk)
+            self._retry_at -= self._pos
+            self._pos = 0
+            for element in self._parse(final=False):
+                yield element
+        self._buffer = self._buffer[self._pos:] + self._text.decode(b'', final=True)
+        self._pos = 0
+        for element in self._parse(final=True):
+            yield element
+
+@asynccontextmanager
+async def _streamed_items(controller: Controller, url: str, headers: Dict[str, str]) -> AsyncIterator[JSONItemStream]:
+    """GET url as a stream and parse its items incrementally; the response is closed on exit"""
+    response = await _request(controller, "GET", url, headers=headers, stream=True)
+    try:
+        if response.is_error:
+            await response.aread()
+            response.raise_for_status()
+        stream = JSONItemStream(response.aiter_bytes(stream_chunk_size))
+        yield stream
+    finally:
+        await response.aclose()
+    telemetry.record_bytes(controller.name, "GET", url, stream.bytes)
+
+async def _paged_stream(
+    controller: Controller,
+    url: str,
+    headers: Dict[str, str],
+    fields: Optional[List[str]],
+    filter: Optional[Dict[str, Any]],
+    limit: Optional[int],
+    cursor: Optional[str],
+    items_only: bool = False
+) -> Any:
+    """
+    Streaming counterpart of _paged for a GET returning {"items": [...]}: the body
+    is parsed item by item and filtering, projection and paging happen as items
+    arrive, so at most one page is held in memory. Without paging arguments a
+    result that fits max_response_bytes comes back as the document (or just its
+    items with items_only), otherwise as one page.
+    """
+    pager = _Pager(fields, filter, limit, cursor)
+    async with _streamed_items(controller, url, headers) as stream:
+        async for item in stream.items():
+            pager.add(item)
+    page = pager.page()
+    if fields is None and filter is None and limit is None and cursor is None and page["next_cursor"] is None:
+        if items_only:
+            return page["items"] if stream.found else None
+        return dict(stream.rest, items=page["items"]) if stream.found else stream.rest
+    return page
+
+# Alert and metric polling (see alert_poll_interval)
+
+def _poll_sources(controller: Controller) -> Dict[str, Tuple[EventBuffer, str, Optional[Callable[[Any], bool]]]]:
+    """Poll kind -> (buffer, URL, record filter)"""
+    series = set(metric_poll_series)
+    return {
+        "alerts": (controller.alerts, f'https://{controller.server}/api/alert-events', None),
+        "metrics": (
+            controller.metrics, f'https://{controller.server}/api/metricdb/metric',
+            (lambda record: isinstance(record, dict) and record.get("name") in series) if series else None
+        ),
+    }
+
+async def poll_once(controller: Controller, kind: str) -> int:
+    """Fetch alert events or metrics once into the controller's buffer; returns the number of new records"""
+    buffer, url, select = _poll_sources(controller)[kind]
     try:
-        headers = auth(aos_server, username, password)
+        headers = await auth(controller)
         if not headers:
+            raise RuntimeError("Authentication failed")
+        async with _streamed_items(controller, url, headers) as stream:
+            records = [record async for record in stream.items() if select is None or select(record)]
+        return buffer.ingest(records)
+    except Exception as e:
+        buffer.last_error = str(e)
+        raise
+
+async def _poll_forever(controller: Controller, kind: str, interval: float) -> None:
+    controller.polling.add(kind)
+    try:
+        while True:
+            try:
+                await poll_once(controller, kind)
+            except Exception as e:
+                print(f"Polling {kind} of {controller.name} failed: {e}", file=sys.stderr)
+            try:
+                await asyncio.sleep(interval)
+            except (TypeError, ValueError) as e:
+                print(f"Polling {kind} of {controller.name} stopped: {e}", file=sys.stderr)
+                return
+    finally:
+        controller.polling.discard(kind)
+
+def start_pollers() -> List[asyncio.Task]:
+    """Start one background poller per controller for alerts and metrics, as configured"""
+    intervals = {"alerts": alert_poll_interval, "metrics": metric_poll_interval}
+    tasks = []
+    if not any(intervals.values()):
+        return tasks
+    loop = asyncio.get_running_loop()
+    for controller in get_controllers().values():
+        for kind, interval in intervals.items():
+            if interval:
+                tasks.append(loop.create_task(_poll_forever(controller, kind, interval)))
+    return tasks
+
+async def stop_pollers(tasks: List[asyncio.Task]) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def _events_since(kind: str, cursor: Optional[str], limit: Optional[int], instance: Optional[str]) -> dict:
+    """
+    Records of one poll kind after cursor. Served from the ring buffer when the
+    background poller runs, otherwise after polling once on demand.
+    """
+    controller = get_controller(instance)
+    if kind not in controller.polling:
+        await poll_once(controller, kind)
+    buffer = controller.alerts if kind == "alerts" else controller.metrics
+    result = buffer.since(cursor, limit)
+    result["polling"] = kind in controller.polling
+    return result
+
+# Idempotency checks for writes that are not safe to replay blindly (see _send).
+# Each returns the object when the earlier attempt took effect, or None when it did not.
+
+def _vn_created_check(controller: Controller, blueprint_id: str, headers: Dict[str, str],
+                      vn_name: str, security_zone_id: str) -> Callable[[], Awaitable[Optional[dict]]]:
+    async def check() -> Optional[dict]:
+        invalidate_blueprint(controller, blueprint_id)
+        index = await _blueprint_index(controller, blueprint_id, headers)
+        vn_id = index.vn_ids.get((vn_name, security_zone_id))
+        return {"id": vn_id} if vn_id else None
+    return check
+
+def _vns_deleted_check(controller: Controller, blueprint_id: str, headers: Dict[str, str],
+                       vn_ids: List[str]) -> Callable[[], Awaitable[Optional[dict]]]:
+    async def check() -> Optional[dict]:
+        invalidate_blueprint(controller, blueprint_id)
+        index = await _blueprint_index(controller, blueprint_id, headers)
+        if any(vn_id in index.vn_keys for vn_id in vn_ids):
             return None
-        url = f'https://{aos_server}/api/blueprints'
-        response = httpx.get(url, headers=headers, verify=False)
+        return {"status": "success", "virtual_network_ids": vn_ids}
+    return check
+
+def _security_zone_created_check(controller: Controller, blueprint_id: str, headers: Dict[str, str],
+                                 label: str) -> Callable[[], Awaitable[Optional[dict]]]:
+    async def check() -> Optional[dict]:
+        invalidate_blueprint(controller, blueprint_id)
+        index = await _blueprint_index(controller, blueprint_id, headers)
+        sz_id = index.sz_ids.get(label)
+        return {"id": sz_id} if sz_id else None
+    return check
+
+def _blueprint_created_check(controller: Controller, headers: Dict[str, str],
+                             label: str) -> Callable[[], Awaitable[Optional[dict]]]:
+    async def check() -> Optional[dict]:
+        response = await _request(controller, "GET", f'https://{controller.server}/api/blueprints', headers=headers)
         response.raise_for_status()
-        return response.json().get('items')
+        for blueprint in response.json().get('items') or []:
+            if blueprint.get('label') == label:
+                return {"id": blueprint.get('id')}
+        return None
+    return check
+
+async def _blueprint_list(instance: Optional[str], refresh: bool = False) -> Optional[List[dict]]:
+    """Every blueprint of one controller (cached briefly), or None if authentication failed"""
+    controller = get_controller(instance)
+    headers = await auth(controller)
+    if not headers:
+        return None
+    url = f'https://{controller.server}/api/blueprints'
+    return (await _cached_get(controller, url, headers, blueprint_list_cache_ttl, refresh)).get('items') or []
+
+@mcp.tool()
+async def get_bp(
+    fields: Optional[List[str]] = None,
+    filter: Optional[Dict[str, Any]] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    refresh: bool = False,
+    instance: Optional[str] = None
+) -> Union[List[dict], dict, None]:
+    """
+    Gets blueprint information (cached briefly, set refresh=True to bypass). With instance='*'
+    the blueprints of all controllers are merged, each tagged with its instance.
+    Optional fields/filter/limit/cursor return a page of items: fields projects (dotted) keys,
+    filter matches field values, and next_cursor continues a page cut by limit or the size budget.
+    """
+    try:
+        if instance == ALL_INSTANCES:
+            items = []
+            for name, result in (await fan_out(lambda name: _blueprint_list(name, refresh))).items():
+                if not isinstance(result, list):
+                    items.append({"instance": name, "error": "Could not list blueprints"})
+                else:
+                    items.extend(dict(bp, instance=name) for bp in result)
+            return _paged(items, items, fields, filter, limit, cursor)
+
+        items = await _blueprint_list(instance, refresh)
+        if items is None:
+            return None
+        return _paged(items, items, fields, filter, limit, cursor)
     except Exception as e:
         print(f"An unexpected error occurred in get_bp: {e}", file=sys.stderr)
         return None
 
 @mcp.tool()
-def get_racks(blueprint_id: str) -> Optional[List[dict]]:
-    """Gets rack information for a blueprint"""
+async def get_racks(blueprint_id: str, refresh: bool = False, instance: Optional[str] = None) -> Optional[List[dict]]:
+    """Gets rack information for a blueprint (cached per blueprint version)"""
     try:
-        headers = auth(aos_server, username, password)
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return None
-        url = f'https://{aos_server}/api/blueprints/{blueprint_id}/racks'
-        response = httpx.get(url, headers=headers, verify=False)
-        response.raise_for_status()
-        return response.json().get('items')
+        url = f'https://{controller.server}/api/blueprints/{blueprint_id}/racks'
+        data = await _blueprint_get(controller, blueprint_id, url, headers, refresh)
+        return data.get('items')
     except Exception as e:
         print(f"An unexpected error occurred in get_racks: {e}", file=sys.stderr)
         return None
 
 @mcp.tool()
-def get_rz(blueprint_id: str) -> Optional[dict]:
-    """Gets routing zone information for a blueprint"""
+async def get_rz(blueprint_id: str, refresh: bool = False, instance: Optional[str] = None) -> Optional[dict]:
+    """Gets routing zone information for a blueprint (cached per blueprint version)"""
     try:
-        headers = auth(aos_server, username, password)
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return None
-        url = f'https://{aos_server}/api/blueprints/{blueprint_id}/security-zones'
-        response = httpx.get(url, headers=headers, verify=False)
-        response.raise_for_status()
-        return response.json()
+        url = f'https://{controller.server}/api/blueprints/{blueprint_id}/security-zones'
+        return await _blueprint_get(controller, blueprint_id, url, headers, refresh)
     except Exception as e:
         print(f"An unexpected error occurred in get_rz: {e}", file=sys.stderr)
         return None
 
 @mcp.tool()
-def create_vn(blueprint_id: str, security_zone_id: str, vn_name: str) -> Optional[dict]:
-    """Creates a virtual network in a given blueprint and routing zone"""
+async def create_vn(
+    blueprint_id: str,
+    security_zone_id: str,
+    vn_name: str,
+    vni: Optional[int] = None,
+    allocate: bool = False,
+    instance: Optional[str] = None
+) -> Optional[dict]:
+    """
+    Creates a virtual network in a given blueprint and routing zone.
+    With allocate=True a missing vni is taken from the VNI pools and a given one is checked for conflicts.
+    """
+    reserved: Dict[str, int] = {}
+    created = None
     try:
-        headers = auth(aos_server, username, password)
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return None
-        url = f'https://{aos_server}/api/blueprints/{blueprint_id}/virtual-networks'
+        url = f'https://{controller.server}/api/blueprints/{blueprint_id}/virtual-networks'
         data = {
             "label": vn_name,
             "vn_type": "vxlan",
             "security_zone_id": security_zone_id
         }
-        response = httpx.post(url, json=data, headers=headers, verify=False)
+        if allocate:
+            try:
+                reserved = await _reserve(controller, blueprint_id, headers, {"vni": vni})
+            except ValueError as e:
+                return {"error": str(e)}
+            vni = reserved["vni"]
+        if vni is not None:
+            data["vn_id"] = str(vni)
+        response = await _request(
+            controller, "POST", url, json=data, headers=headers,
+            idempotency_check=_vn_created_check(controller, blueprint_id, headers, vn_name, security_zone_id)
+        )
+        invalidate_blueprint(controller, blueprint_id)
         response.raise_for_status()
-        return response.json()
+        created = response.json()
+        _index_write(controller, blueprint_id, lambda index: index.add_vn(created.get('id'), vn_name, security_zone_id, vni))
+        return created
     except Exception as e:
         print(f"An unexpected error occurred in create_vn: {e}", file=sys.stderr)
         return None
+    finally:
+        if reserved:
+            _release(controller, blueprint_id, reserved, created is not None)
 
 @mcp.tool()
-def get_diff_status(blueprint_id: str) -> Optional[dict]:
+async def get_diff_status(blueprint_id: str, instance: Optional[str] = None) -> Optional[dict]:
     """Gets the diff status for a blueprint"""
     try:
-        headers = auth(aos_server, username, password)
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return None
-        url = f'https://{aos_server}/api/blueprints/{blueprint_id}/diff-status'
-        response = httpx.get(url, headers=headers, verify=False)
+        url = f'https://{controller.server}/api/blueprints/{blueprint_id}/diff-status'
+        response = await _request(controller, "GET", url, headers=headers)
         response.raise_for_status()
         return response.json()
     except Exception as e:
@@ -127,18 +2208,20 @@ def get_diff_status(blueprint_id: str) -> Optional[dict]:
         return None
 
 @mcp.tool()
-def deploy(blueprint_id: str, description: str, staging_version: int) -> Optional[dict]:
+async def deploy(blueprint_id: str, description: str, staging_version: int, instance: Optional[str] = None) -> Optional[dict]:
     """Deploys the config for a blueprint"""
     try:
-        headers = auth(aos_server, username, password)
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return None
-        url = f'https://{aos_server}/api/blueprints/{blueprint_id}/deploy'
+        url = f'https://{controller.server}/api/blueprints/{blueprint_id}/deploy'
         data = {
             "version": staging_version,
             "description": description
         }
-        response = httpx.put(url, json=data, headers=headers, verify=False)
+        response = await _request(controller, "PUT", url, json=data, headers=headers)
+        invalidate_blueprint(controller, blueprint_id)
         response.raise_for_status()
         return response.json()
     except Exception as e:
@@ -146,14 +2229,83 @@ def deploy(blueprint_id: str, description: str, staging_version: int) -> Optiona
         return None
 
 @mcp.tool()
-def delete_bp(blueprint_id: str) -> dict:
+async def deploy_and_wait(
+    blueprint_id: str,
+    description: str,
+    timeout: Optional[float] = None,
+    instance: Optional[str] = None,
+    ctx: Optional[Context] = None
+) -> dict:
+    """
+    Deploys the current staging version of a blueprint and waits until the deploy finishes.
+    Diff status is polled server-side with exponential backoff; progress is reported to the client.
+    Returns the final status (deployed, failed or timeout), the elapsed time and the last diff status.
+    """
+    started = time.monotonic()
+    deadline = started + (timeout or deploy_timeout)
+
+    async def progress(message: str) -> None:
+        if ctx is not None:
+            await ctx.report_progress(time.monotonic() - started, None, message)
+
+    try:
+        diff = await get_diff_status(blueprint_id, instance)
+        if diff is None:
+            return {"error": "Could not read diff status", "status": "failed"}
+        version = diff.get("staging_version")
+        if version is None:
+            return {"error": "No staging version in diff status", "status": "failed", "diff_status": diff}
+        if diff.get("deployed_version") == version:
+            return {"status": "deployed", "version": version, "elapsed_s": 0.0,
+                    "message": "Nothing to deploy", "diff_status": diff}
+
+        result = await deploy(blueprint_id, description, version, instance)
+        if result is None:
+            return {"error": "Deploy request failed", "status": "failed", "version": version}
+        await progress(f"Deploying version {version}")
+
+        delay, polls, status = deploy_poll_initial, 0, "timeout"
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+            delay = min(delay * 2, deploy_poll_max)
+            polls += 1
+            latest = await get_diff_status(blueprint_id, instance)
+            if latest is None:
+                continue
+            diff = latest
+            deploy_status = diff.get("deploy_status")
+            if deploy_status == "failure" or diff.get("deploy_error"):
+                status = "failed"
+                break
+            deployed = diff.get("deployed_version")
+            if isinstance(deployed, int) and deployed >= version and deploy_status in (None, "success"):
+                status = "deployed"
+                break
+            await progress(f"Waiting for version {version} (deployed: {deployed}, status: {deploy_status})")
+
+        elapsed = round(time.monotonic() - started, 1)
+        await progress(f"Deploy of version {version} {status} after {elapsed}s")
+        return {"status": status, "version": version, "elapsed_s": elapsed, "polls": polls, "diff_status": diff}
+
+    except Exception as e:
+        error_msg = f"An unexpected error occurred in deploy_and_wait: {e}"
+        print(error_msg, file=sys.stderr)
+        return {"error": error_msg, "status": "failed"}
+
+@mcp.tool()
+async def delete_bp(blueprint_id: str, instance: Optional[str] = None) -> dict:
     """Delete the blueprint from Apstra Instance"""
     try:
-        headers = auth(aos_server, username, password)
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return {"error": "Authentication failed"}
-        url = f'https://{aos_server}/api/blueprints/{blueprint_id}'
-        response = httpx.delete(url, headers=headers, verify=False, timeout=30.0)
+        url = f'https://{controller.server}/api/blueprints/{blueprint_id}'
+        response = await _request(controller, "DELETE", url, headers=headers)
+        invalidate_blueprint(controller, blueprint_id)
+        invalidate_blueprint_list(controller)
+        controller.blueprint_indexes.pop(blueprint_id, None)
+        controller.blueprint_graphs.pop(blueprint_id, None)
         response.raise_for_status()
 
         # Handle empty response
@@ -172,60 +2324,51 @@ def delete_bp(blueprint_id: str) -> dict:
         return {"error": error_msg, "status": "failed"}
 
 @mcp.tool()
-def create_blueprint_from_template(
+async def create_blueprint_from_template(
     label: str,
     template_name: str = "USE_YOUR_OWN_TEMPLATE",  # Changed default
-    init_type: str = "template_reference"
+    init_type: str = "template_reference",
+    refresh: bool = False,
+    instance: Optional[str] = None
 ) -> dict:
     """
     Creates a new blueprint using a specified template.
+    The template catalog is cached; set refresh=True to re-read it from Apstra.
     """
     try:
-        headers = auth(aos_server, username, password)
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return {"error": "Authentication failed"}
 
         # 1. Get available templates
-        templates_url = f"https://{aos_server}/api/design/templates"
-        templates_resp = httpx.get(templates_url, headers=headers, verify=False)
-        templates_resp.raise_for_status()
-
-        templates_data = templates_resp.json()
-
-        # Handle both dict and list responses
-        if isinstance(templates_data, dict):
-            templates = templates_data.get("items", {})
-            if isinstance(templates, list):
-                templates = {t.get("id", idx): t for idx, t in enumerate(templates)}
-        elif isinstance(templates_data, list):
-            templates = {t.get("id", idx): t for idx, t in enumerate(templates_data)}
-        else:
-            templates = {}
-
-        # 2. Find the specified template
-        target_template = None
-        for template_id, template_data in templates.items():
-            t_name = template_data.get("display_name") or template_data.get("label") or template_data.get("name")
-            if t_name == template_name:
-                target_template = template_data
-                target_template["id"] = template_id
-                break
+        templates_url = f"https://{controller.server}/api/design/templates"
+        templates_data = await _cached_get(
+            controller, templates_url, headers, catalog_cache_ttl['/api/design/templates'], refresh
+        )
 
-        if not target_template:
-            available = [t.get("display_name") or t.get("label") or t.get("name") for t in templates.values()]
-            return {"error": f"Template '{template_name}' not found", "available_templates": available}
+        # 2. Find the specified template by name
+        template_ids = _template_ids(controller, templates_data)
+        template_id = template_ids.get(template_name)
+
+        if template_id is None:
+            return {"error": f"Template '{template_name}' not found", "available_templates": list(template_ids)}
 
         # 3. Create blueprint
-        create_url = f"https://{aos_server}/api/blueprints"
+        create_url = f"https://{controller.server}/api/blueprints"
         data = {
             "label": label,
-            "template_id": target_template["id"],
+            "template_id": template_id,
             "design": "two_stage_l3clos",
             "init_type": init_type
         }
 
         print(f"Creating blueprint with data: {data}", file=sys.stderr)
-        create_resp = httpx.post(create_url, json=data, headers=headers, verify=False)
+        create_resp = await _request(
+            controller, "POST", create_url, json=data, headers=headers,
+            idempotency_check=_blueprint_created_check(controller, headers, label)
+        )
+        invalidate_blueprint_list(controller)
         create_resp.raise_for_status()
 
         if not create_resp.text or create_resp.text == '':
@@ -243,18 +2386,16 @@ def create_blueprint_from_template(
         return {"error": error_msg}
 
 @mcp.tool()
-def list_virtual_networks(blueprint_id: str) -> dict:
-    """List all virtual networks in a blueprint"""
+async def list_virtual_networks(blueprint_id: str, refresh: bool = False, instance: Optional[str] = None) -> dict:
+    """List all virtual networks in a blueprint (cached per blueprint version)"""
     try:
-        headers = auth(aos_server, username, password)
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return {"error": "Authentication failed"}
 
-        url = f'https://{aos_server}/api/blueprints/{blueprint_id}/experience/web/virtual-networks'
-        response = httpx.get(url, headers=headers, verify=False)
-        response.raise_for_status()
-
-        data = response.json()
+        url = f'https://{controller.server}/api/blueprints/{blueprint_id}/experience/web/virtual-networks'
+        data = await _blueprint_get(controller, blueprint_id, url, headers, refresh)
         virtual_networks = data.get("virtual_networks", {})
 
         return {
@@ -273,38 +2414,34 @@ def list_virtual_networks(blueprint_id: str) -> dict:
         return {"error": error_msg}
 
 @mcp.tool()
-def delete_vn(blueprint_id: str, security_zone_id: str, vn_name: str) -> dict:
-    """delete a virtual network in a given blueprint and routing zone"""
+async def delete_vn(blueprint_id: str, security_zone_id: str, vn_name: str, instance: Optional[str] = None) -> dict:
+    """delete a virtual network in a given blueprint and routing zone (ID or label)"""
     try:
-        headers = auth(aos_server, username, password)
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return {"error": "Authentication failed"}
 
-        # First, get the virtual network ID by listing all VNs
-        list_url = f'https://{aos_server}/api/blueprints/{blueprint_id}/virtual-networks'
-        list_response = httpx.get(list_url, headers=headers, verify=False)
-        list_response.raise_for_status()
-
-        vn_id = None
-        vns = list_response.json()
-
-        # Find the VN ID by matching name and security zone
-        if 'virtual_networks' in vns:
-            for vn in vns['virtual_networks'].values():
-                if vn.get('label') == vn_name and vn.get('security_zone_id') == security_zone_id:
-                    vn_id = vn.get('id')
-                    break
+        # First, look up the virtual network ID by name and security zone
+        index = await _blueprint_index(controller, blueprint_id, headers)
+        security_zone_id = index.security_zone_id(security_zone_id)
+        vn_id = index.vn_ids.get((vn_name, security_zone_id))
 
         if not vn_id:
             return {"error": f"Virtual network '{vn_name}' not found in security zone {security_zone_id}"}
 
         # Now delete using the VN ID
-        url = f'https://{aos_server}/api/blueprints/{blueprint_id}/delete-virtual-networks'
+        url = f'https://{controller.server}/api/blueprints/{blueprint_id}/delete-virtual-networks'
         data = {
             "virtual_network_ids": [vn_id]  # API expects a list of IDs
         }
-        response = httpx.post(url, json=data, headers=headers, verify=False)
+        response = await _request(
+            controller, "POST", url, json=data, headers=headers,
+            idempotency_check=_vns_deleted_check(controller, blueprint_id, headers, [vn_id])
+        )
+        invalidate_blueprint(controller, blueprint_id)
         response.raise_for_status()
+        _index_write(controller, blueprint_id, lambda index: index.remove_vns([vn_id]))
 
         # Handle empty response
         if not response.text or response.text == '':
@@ -324,74 +2461,609 @@ def delete_vn(blueprint_id: str, security_zone_id: str, vn_name: str) -> dict:
         return {"error": error_msg}
 
 @mcp.tool()
-def get_devices_os(blueprint_id: str) -> Optional[List[dict]]:
-    """Gets devices OS from a blueprint"""
+async def create_vns_bulk(
+    blueprint_id: str,
+    virtual_networks: List[Dict[str, Any]],
+    max_concurrency: Optional[int] = None,
+    allocate: bool = False,
+    instance: Optional[str] = None
+) -> dict:
+    """
+    Creates many virtual networks in a blueprint concurrently.
+    Each item needs a 'name' and a 'security_zone_id' (ID or label) and may give a 'vni';
+    the result lists the outcome of every item.
+    With allocate=True items without a vni get one from the VNI pools and given ones are checked for conflicts.
+    """
+    try:
+        controller = get_controller(instance)
+        headers = await auth(controller)
+        if not headers:
+            return {"error": "Authentication failed"}
+
+        url = f'https://{controller.server}/api/blueprints/{blueprint_id}/virtual-networks'
+        limit = asyncio.Semaphore(max(1, max_concurrency or bulk_max_concurrency))
+        # Security zone labels are resolved like delete_vns_bulk does
+        zones = await _blueprint_index(controller, blueprint_id, headers)
+
+        async def create_one(item: Dict[str, Any]) -> dict:
+            result = {"name": item.get("name"), "security_zone_id": item.get("security_zone_id")}
+            if not result["name"] or not result["security_zone_id"]:
+                result["error"] = "Each item needs a 'name' and a 'security_zone_id'"
+                return result
+            security_zone_id = zones.security_zone_id(result["security_zone_id"])
+            data = {
+                "label": result["name"],
+                "vn_type": "vxlan",
+                "security_zone_id": security_zone_id
+            }
+            vni = _as_int(item.get("vni"))
+            reserved: Dict[str, int] = {}
+            try:
+                if allocate:
+                    reserved = await _reserve(controller, blueprint_id, headers, {"vni": vni})
+                    vni = reserved["vni"]
+                if vni is not None:
+                    data["vn_id"] = str(vni)
+                    result["vni"] = vni
+                async with limit:
+                    response = await _request(
+                        controller, "POST", url, json=data, headers=headers,
+                        idempotency_check=_vn_created_check(
+                            controller, blueprint_id, headers, result["name"], security_zone_id
+                        )
+                    )
+                response.raise_for_status()
+                result["status"] = "created"
+                if response.text:
+                    result["id"] = response.json().get("id")
+                _index_write(controller, blueprint_id, lambda index: index.add_vn(
+                    result.get("id"), result["name"], security_zone_id, vni
+                ))
+            except httpx.HTTPStatusError as e:
+                result["error"] = f"HTTP {e.response.status_code}: {e.response.text}"
+            except Exception as e:
+                result["error"] = str(e)
+            finally:
+                if reserved:
+                    _release(controller, blueprint_id, reserved, "error" not in result)
+            return result
+
+        try:
+            results = await asyncio.gather(*(create_one(item) for item in virtual_networks))
+        finally:
+            invalidate_blueprint(controller, blueprint_id)
+
+        failed = sum(1 for r in results if "error" in r)
+        return {"results": results, "created": len(results) - failed, "failed": failed}
+
+    except Exception as e:
+        error_msg = f"An unexpected error occurred in create_vns_bulk: {e}"
+        print(error_msg, file=sys.stderr)
+        return {"error": error_msg}
+
+@mcp.tool()
+async def delete_vns_bulk(blueprint_id: str, virtual_networks: List[Dict[str, str]], instance: Optional[str] = None) -> dict:
+    """
+    Deletes many virtual networks in a blueprint with a single request.
+    Each item needs a 'name' and a 'security_zone_id' (ID or label); the result lists the outcome of every item.
+    """
+    try:
+        controller = get_controller(instance)
+        headers = await auth(controller)
+        if not headers:
+            return {"error": "Authentication failed"}
+
+        # Resolve every ID from the blueprint's name index
+        index = await _blueprint_index(controller, blueprint_id, headers)
+
+        results = []
+        for item in virtual_networks:
+            result = {"name": item.get("name"), "security_zone_id": item.get("security_zone_id")}
+            security_zone_id = index.security_zone_id(result["security_zone_id"])
+            vn_id = index.vn_ids.get((result["name"], security_zone_id))
+            if vn_id:
+                result["id"] = vn_id
+            else:
+                result["error"] = f"Virtual network '{result['name']}' not found in security zone {result['security_zone_id']}"
+            results.append(result)
+
+        to_delete = list(dict.fromkeys(r["id"] for r in results if "id" in r))
+        if to_delete:
+            url = f'https://{controller.server}/api/blueprints/{blueprint_id}/delete-virtual-networks'
+            response = await _request(
+                controller, "POST", url, json={"virtual_network_ids": to_delete}, headers=headers,
+                idempotency_check=_vns_deleted_check(controller, blueprint_id, headers, to_delete)
+            )
+            invalidate_blueprint(controller, blueprint_id)
+            if response.is_success:
+                outcome = {"status": "deleted"}
+                _index_write(controller, blueprint_id, lambda index: index.remove_vns(to_delete))
+            else:
+                outcome = {"error": f"HTTP {response.status_code}: {response.text}"}
+            for result in results:
+                if "id" in result:
+                    result.update(outcome)
+
+        failed = sum(1 for r in results if "error" in r)
+        return {"results": results, "deleted": len(results) - failed, "failed": failed}
+
+    except httpx.HTTPStatusError as e:
+        error_msg = f"HTTP {e.response.status_code}: {e.response.text}"
+        print(error_msg, file=sys.stderr)
+        return {"error": error_msg}
+    except Exception as e:
+        error_msg = f"An unexpected error occurred in delete_vns_bulk: {e}"
+        print(error_msg, file=sys.stderr)
+        return {"error": error_msg}
+
+@mcp.tool()
+async def get_fabric_snapshot(
+    blueprint_ids: Optional[List[str]] = None,
+    parallelism: Optional[int] = None,
+    instance: Optional[str] = None
+) -> dict:
+    """
+    Gets a compact overview of the fabric in one call: racks, routing zones, virtual networks
+    and diff status of every blueprint (or only blueprint_ids), fetched concurrently.
+    Each blueprint reports how long every sub-request took. instance='*' snapshots every controller.
+    """
+    if instance == ALL_INSTANCES:
+        return await fan_out(lambda name: get_fabric_snapshot(blueprint_ids, parallelism, name))
+
+    started = time.perf_counter()
+    limit = asyncio.Semaphore(max(1, parallelism or snapshot_parallelism))
+
+    async def timed(call) -> Tuple[Any, float]:
+        async with limit:
+            t0 = time.perf_counter()
+            result = await call
+            return result, round((time.perf_counter() - t0) * 1000, 1)
+
+    async def summarize(blueprint: dict) -> dict:
+        blueprint_id = blueprint["id"]
+        (racks, racks_ms), (zones, zones_ms), (vns, vns_ms), (diff, diff_ms) = await asyncio.gather(
+            timed(get_racks(blueprint_id, instance=instance)),
+            timed(get_rz(blueprint_id, instance=instance)),
+            timed(list_virtual_networks(blueprint_id, instance=instance)),
+            timed(get_diff_status(blueprint_id, instance))
+        )
+        summary = {
+            "id": blueprint_id,
+            "label": blueprint.get("label"),
+            "status": blueprint.get("status"),
+            "timings_ms": {"racks": racks_ms, "routing_zones": zones_ms, "virtual_networks": vns_ms, "diff_status": diff_ms}
+        }
+        errors = []
+        if racks is None:
+            errors.append("racks")
+        else:
+            summary["racks"] = len(racks)
+        if zones is None:
+            errors.append("routing_zones")
+        else:
+            summary["routing_zones"] = sorted(str(z.get("label")) for z in _items(zones).values())
+        if vns is None or "error" in vns:
+            errors.append("virtual_networks")
+        else:
+            summary["virtual_networks"] = vns["count"]
+            summary["version"] = vns.get("version")
+        if diff is None:
+            errors.append("diff_status")
+        else:
+            summary["diff_status"] = {
+                key: diff.get(key) for key in ("status", "staging_version", "deployed_version") if key in diff
+            }
+        if errors:
+            summary["errors"] = errors
+        return summary
+
+    try:
+        timings_ms = {}
+        if blueprint_ids is None:
+            blueprints, timings_ms["blueprints"] = await timed(_blueprint_list(instance))
+            if blueprints is None:
+                return {"error": "Could not list blueprints"}
+        else:
+            blueprints = [{"id": blueprint_id} for blueprint_id in blueprint_ids]
+
+        summaries = await asyncio.gather(*(summarize(bp) for bp in blueprints))
+        timings_ms["total"] = round((time.perf_counter() - started) * 1000, 1)
+        return {"blueprints": summaries, "count": len(summaries), "timings_ms": timings_ms}
+
+    except Exception as e:
+        error_msg = f"An unexpected error occurred in get_fabric_snapshot: {e}"
+        print(error_msg, file=sys.stderr)
+        return {"error": error_msg}
+
+@mcp.tool()
+async def query_blueprint(
+    blueprint_id: str,
+    match: List[List[Dict[str, Any]]],
+    distinct: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    refresh: bool = False,
+    instance: Optional[str] = None
+) -> dict:
+    """
+    Runs one graph query on a blueprint and returns only the matching subgraph.
+    match is a list of paths; each path is a list of steps, starting with a node:
+      {"node": "system", "name": "leaf", "role": "leaf"}  node of a type, bound to an alias, with property filters
+      {"out": "hosted_vn_instances"} / {"in": "member_vns"}  follow a relationship
+    A list as a filter value matches any of its values. distinct de-duplicates on the given aliases.
+    Example (leafs carrying VN "blue"): [[{"node": "virtual_network", "label": "blue"}, {"out": "instantiated_by"},
+      {"node": "vn_instance"}, {"in": "hosted_vn_instances"}, {"node": "system", "name": "leaf", "role": "leaf"}]]
+    Results are cached per blueprint version; limit/cursor page the items.
+    """
     try:
-        headers = auth(aos_server, username, password)
+        spec = json.dumps({"match": match, "distinct": distinct or []}, sort_keys=True, separators=(',', ':'))
+        try:
+            query = _compile_query(spec)
+        except ValueError as e:
+            return {"error": f"Invalid match spec: {e}"}
+        controller = get_controller(instance)
+        headers = await auth(controller)
+        if not headers:
+            return {"error": "Authentication failed"}
+        data = await _blueprint_query(controller, blueprint_id, query, headers, refresh)
+        items = data.get("items") if isinstance(data, dict) else data
+        result = _page(items, None, None, limit, cursor) if isinstance(items, list) else {"items": items}
+        result["query"] = query
+        return result
+
+    except httpx.HTTPStatusError as e:
+        error_msg = f"HTTP {e.response.status_code}: {e.response.text}"
+        print(f"HTTP error in query_blueprint: {error_msg}", file=sys.stderr)
+        return {"error": error_msg}
+    except Exception as e:
+        error_msg = f"An unexpected error occurred in query_blueprint: {e}"
+        print(error_msg, file=sys.stderr)
+        return {"error": error_msg}
+
+GRAPH_QUERIES = ("summary", "nodes", "neighbors", "vn_leafs", "vns_per_routing_zone")
+
+@mcp.tool()
+async def query_blueprint_graph(
+    blueprint_id: str,
+    query: str = "summary",
+    node: Optional[str] = None,
+    type: Optional[str] = None,
+    label: Optional[str] = None,
+    role: Optional[str] = None,
+    relationship: Optional[str] = None,
+    direction: str = "out",
+    limit: Optional[int] = None,
+    refresh: bool = False,
+    instance: Optional[str] = None
+) -> dict:
+    """
+    Answers topology questions from an in-memory mirror of the blueprint graph, resynced when the blueprint version changes.
+    Queries:
+      summary - node counts by type and role
+      nodes - nodes filtered by type, label and/or role
+      neighbors - neighbours of `node` (ID or label) over `relationship` in `direction` (out, in or both), filtered by type/role
+      vn_leafs - leaf switches carrying virtual network `node` (ID or label)
+      vns_per_routing_zone - virtual network labels per routing zone
+    """
+    try:
+        if query not in GRAPH_QUERIES:
+            return {"error": f"Unknown query '{query}', expected one of: {', '.join(GRAPH_QUERIES)}"}
+        controller = get_controller(instance)
+        headers = await auth(controller)
+        if not headers:
+            return {"error": "Authentication failed"}
+        graph = await _blueprint_graph(controller, blueprint_id, headers, refresh)
+        started = time.perf_counter()
+
+        if query == "summary":
+            result: Dict[str, Any] = {
+                "nodes": len(graph.nodes),
+                "relationships": graph.relationships,
+                "by_type": {t: len(ids) for t, ids in sorted(graph.by_type.items())},
+                "by_role": {r: len(ids) for r, ids in sorted(graph.by_role.items())}
+            }
+        elif query == "vns_per_routing_zone":
+            result = {"routing_zones": {
+                str(zone.label): sorted(str(vn.label) for vn in graph.walk([zone.id], [("out", "member_vns", "virtual_network")]))
+                for zone in graph.find(type="security_zone")
+            }}
+        else:
+            if query == "nodes":
+                nodes = graph.find(type, label, role)
+            else:
+                if not node:
+                    return {"error": f"Query '{query}' needs a node"}
+                start = graph.resolve(node, "virtual_network" if query == "vn_leafs" else None)
+                if not start:
+                    return {"error": f"Node '{node}' not found in blueprint {blueprint_id}"}
+                if query == "vn_leafs":
+                    nodes = [n for n in graph.walk([n.id for n in start], [
+                        ("out", "instantiated_by", "vn_instance"), ("in", "hosted_vn_instances", "system")
+                    ]) if n.role == "leaf"]
+                else:
+                    nodes = graph.neighbors([n.id for n in start], direction, relationship, type, role)
+            items = [n.as_dict() for n in (nodes if limit is None else nodes[:max(limit, 0)])]
+            result = {"items": items, "count": len(items), "total": len(nodes)}
+
+        result["version"] = graph.version
+        result["query_us"] = round((time.perf_counter() - started) * 1e6, 1)
+        return result
+
+    except httpx.HTTPStatusError as e:
+        error_msg = f"HTTP {e.response.status_code}: {e.response.text}"
+        print(f"HTTP error in query_blueprint_graph: {error_msg}", file=sys.stderr)
+        return {"error": error_msg}
+    except Exception as e:
+        error_msg = f"An unexpected error occurred in query_blueprint_graph: {e}"
+        print(error_msg, file=sys.stderr)
+        return {"error": error_msg}
+
+@mcp.tool()
+async def get_devices_os(blueprint_id: str, refresh: bool = False, instance: Optional[str] = None) -> Optional[List[dict]]:
+    """Gets devices OS from a blueprint (cached, set refresh=True to bypass)"""
+    try:
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return None
-        url = f'https://{aos_server}/api/device-os/platforms'
-        response = httpx.get(url, headers=headers, verify=False)
-        response.raise_for_status()
-        return response.json().get('items')
+        url = f'https://{controller.server}/api/device-os/platforms'
+        data = await _cached_get(controller, url, headers, catalog_cache_ttl['/api/device-os/platforms'], refresh)
+        return data.get('items')
     except Exception as e:
         print(f"An unexpected error occurred in get_devices_os: {e}", file=sys.stderr)
         return None
 
 @mcp.tool()
-def get_chassis_profiles(blueprint_id: str) -> Optional[List[dict]]:
-    """Gets chassis profile from a blueprint"""
+async def get_chassis_profiles(blueprint_id: str, refresh: bool = False, instance: Optional[str] = None) -> Optional[List[dict]]:
+    """Gets chassis profile from a blueprint (cached, set refresh=True to bypass)"""
     try:
-        headers = auth(aos_server, username, password)
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return None
-        url = f'https://{aos_server}/api/chassis-profiles'
-        response = httpx.get(url, headers=headers, verify=False)
-        response.raise_for_status()
-        return response.json().get('items')
+        url = f'https://{controller.server}/api/chassis-profiles'
+        data = await _cached_get(controller, url, headers, catalog_cache_ttl['/api/chassis-profiles'], refresh)
+        return data.get('items')
     except Exception as e:
         print(f"An unexpected error occurred in get_chassis_profiles: {e}", file=sys.stderr)
         return None
 
 @mcp.tool()
-def get_apstra_version() -> Optional[dict]:
-    """Get Apstra version"""
+async def get_apstra_version(refresh: bool = False, instance: Optional[str] = None) -> Optional[dict]:
+    """Get Apstra version (cached, set refresh=True to bypass). instance='*' returns the version of every controller."""
     try:
-        headers = auth(aos_server, username, password)
+        if instance == ALL_INSTANCES:
+            return await fan_out(lambda name: get_apstra_version(refresh, name))
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return None
-        url = f'https://{aos_server}/api/versions/server'
-        response = httpx.get(url, headers=headers, verify=False)
-        response.raise_for_status()
-        return response.json()
+        url = f'https://{controller.server}/api/versions/server'
+        return await _cached_get(controller, url, headers, catalog_cache_ttl['/api/versions/server'], refresh)
     except Exception as e:
         print(f"An unexpected error occurred in get_apstra_version: {e}", file=sys.stderr)
         return None
 
-def get_alert() -> Optional[dict]:
-    """Gets blueprint alert information"""
+@mcp.tool()
+async def get_cache_stats(flush: bool = False, instance: Optional[str] = None) -> dict:
+    """
+    Gets response cache hit/miss statistics and the number of GETs served by an identical in-flight request.
+    Optionally flushes the cache. instance='*' covers every controller.
+    """
     try:
-        headers = auth(aos_server, username, password)
+        if instance == ALL_INSTANCES:
+            return await fan_out(lambda name: get_cache_stats(flush, name))
+        controller = get_controller(instance)
+        cache = controller.cache
+        stats = cache.stats()
+        stats["coalesced_gets"] = controller.coalesced_gets
+        compiled = _compile_query.cache_info()
+        stats["compiled_queries"] = {"entries": compiled.currsize, "hits": compiled.hits, "misses": compiled.misses}
+        if flush:
+            stats["flushed"] = cache.clear()
+        return stats
+    except Exception as e:
+        return {"error": str(e)}
+
+@mcp.tool()
+async def get_instances() -> dict:
+    """
+    Lists the Apstra controllers this server is configured for.
+    Pass a name as `instance` to any tool; tools that support it also accept '*' for all controllers.
+    """
+    try:
+        controllers = get_controllers()
+        return {
+            "default": _default_instance,
+            "instances": {
+                name: {"server": controller.server, "circuit": controller.breaker.state}
+                for name, controller in controllers.items()
+            }
+        }
+    except Exception as e:
+        return {"error": f"Could not load controllers: {e}"}
+
+# Outcome of the start-up warm-up, reported by server_stats
+_warmup_status: Dict[str, Any] = {"state": "disabled"}
+
+async def warm_up() -> Dict[str, Any]:
+    """
+    Log in to every controller and prefetch the Apstra version, design templates,
+    chassis profiles and blueprint list into the caches the first tool calls read.
+    A tool called meanwhile joins the login and the GETs already in flight.
+    """
+    started = time.perf_counter()
+    _warmup_status.update(state="running", seconds=None, instances={})
+
+    async def warm(name: str) -> Dict[str, Any]:
+        controller = get_controller(name)
+        headers = await auth(controller)
+        if not headers:
+            return {"error": "Authentication failed"}
+        templates_url = f'https://{controller.server}/api/design/templates'
+        results = await asyncio.gather(
+            get_apstra_version(instance=name),
+            _cached_get(controller, templates_url, headers, catalog_cache_ttl['/api/design/templates']),
+            get_chassis_profiles("", instance=name),
+            get_bp(instance=name),
+            return_exceptions=True
+        )
+        names = ("version", "templates", "chassis_profiles", "blueprints")
+        failed = [n for n, r in zip(names, results) if r is None or isinstance(r, BaseException)]
+        return {"prefetched": len(names) - len(failed), "failed": failed}
+
+    _warmup_status["instances"] = await fan_out(warm)
+    _warmup_status.update(state="done", seconds=round(time.perf_counter() - started, 3))
+    print(f"Warm-up finished in {_warmup_status['seconds']}s: {_warmup_status['instances']}", file=sys.stderr)
+    return _warmup_status
+
+def start_warmup() -> Optional[asyncio.Task]:
+    """Start warm_up in the background when enabled; the server does not wait for it"""
+    if not warmup or replay_path:
+        return None
+    return asyncio.get_running_loop().create_task(warm_up())
+
+def _server_stats() -> dict:
+    stats = telemetry.snapshot()
+    stats["warmup"] = _warmup_status
+    stats["controllers"] = {
+        name: dict(controller.cache.stats(), coalesced_gets=controller.coalesced_gets, circuit=controller.breaker.state)
+        for name, controller in get_controllers().items()
+    }
+    return stats
+
+@mcp.tool()
+async def server_stats() -> dict:
+    """
+    Gets server telemetry: per-tool and per-upstream-endpoint latency (p50/p95/p99),
+    error, retry, status and response-size counters, plus cache and circuit state per controller.
+    """
+    try:
+        return _server_stats()
+    except Exception as e:
+        return {"error": str(e)}
+
+@mcp.resource("apstra://server-stats", mime_type="application/json")
+def server_stats_resource() -> str:
+    """Server telemetry, as returned by the server_stats tool"""
+    return json.dumps(_server_stats())
+
+def _prometheus_text() -> str:
+    """Renders telemetry in the Prometheus text exposition format"""
+    def labels(**values) -> str:
+        escaped = {k: str(v).replace('\\', '\\\\').replace('"', '\\"') for k, v in values.items()}
+        return ",".join(f'{k}="{v}"' for k, v in escaped.items())
+
+    def histogram(name: str, hist: Histogram, **values) -> List[str]:
+        lines, cumulative = [], 0
+        for bound, count in zip(hist.buckets, hist.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels(**values, le=bound)}}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels(**values, le="+Inf")}}} {hist.count}')
+        lines.append(f'{name}_sum{{{labels(**values)}}} {hist.total}')
+        lines.append(f'{name}_count{{{labels(**values)}}} {hist.count}')
+        return lines
+
+    # Each family is written as one group: its TYPE line, then all of its samples
+    families: Dict[str, Tuple[str, List[str]]] = {}
+
+    def family(name: str, kind: str) -> List[str]:
+        return families.setdefault(name, (kind, []))[1]
+
+    family("apstra_mcp_uptime_seconds", "gauge").append(f"apstra_mcp_uptime_seconds {time.time() - telemetry.started}")
+    tool_duration = family("apstra_mcp_tool_duration_seconds", "histogram")
+    tool_errors = family("apstra_mcp_tool_errors_total", "counter")
+    upstream_duration = family("apstra_mcp_upstream_duration_seconds", "histogram")
+    upstream_responses = family("apstra_mcp_upstream_responses_total", "counter")
+    upstream_bytes = family("apstra_mcp_upstream_response_bytes_total", "counter")
+    upstream_retries = family("apstra_mcp_upstream_retries_total", "counter")
+    cache_hits = family("apstra_mcp_cache_hits_total", "counter")
+    cache_misses = family("apstra_mcp_cache_misses_total", "counter")
+    coalesced = family("apstra_mcp_coalesced_gets_total", "counter")
+    with telemetry._lock:
+        for name, stats in sorted(telemetry.tools.items()):
+            tool_duration += histogram("apstra_mcp_tool_duration_seconds", stats.latency, tool=name)
+            tool_errors.append(f'apstra_mcp_tool_errors_total{{{labels(tool=name)}}} {stats.errors}')
+        for (controller_name, method, endpoint), stats in sorted(telemetry.upstream.items()):
+            # Not "instance": Prometheus sets that label on every target itself
+            key = dict(controller=controller_name, method=method, endpoint=endpoint)
+            upstream_duration += histogram("apstra_mcp_upstream_duration_seconds", stats.latency, **key)
+            for status, count in stats.statuses.items():
+                upstream_responses.append(f'apstra_mcp_upstream_responses_total{{{labels(**key, status=status)}}} {count}')
+            upstream_bytes.append(f'apstra_mcp_upstream_response_bytes_total{{{labels(**key)}}} {stats.bytes}')
+            upstream_retries.append(f'apstra_mcp_upstream_retries_total{{{labels(**key)}}} {stats.retries}')
+    for name, controller in get_controllers().items():
+        cache = controller.cache.stats()
+        cache_hits.append(f'apstra_mcp_cache_hits_total{{{labels(controller=name)}}} {cache["hits"]}')
+        cache_misses.append(f'apstra_mcp_cache_misses_total{{{labels(controller=name)}}} {cache["misses"]}')
+        coalesced.append(f'apstra_mcp_coalesced_gets_total{{{labels(controller=name)}}} {controller.coalesced_gets}')
+    lines = []
+    for name, (kind, samples) in families.items():
+        lines.append(f"# TYPE {name} {kind}")
+        lines += samples
+    return "\n".join(lines) + "\n"
+
+if prometheus_metrics_path:
+    from starlette.responses import PlainTextResponse
+
+    @mcp.custom_route(prometheus_metrics_path, methods=["GET"])
+    async def prometheus_metrics(request) -> PlainTextResponse:
+        return PlainTextResponse(_prometheus_text(), media_type="text/plain; version=0.0.4")
+
+async def get_alert(
+    fields: Optional[List[str]] = None,
+    filter: Optional[Dict[str, Any]] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    instance: Optional[str] = None
+) -> Optional[dict]:
+    """
+    Gets blueprint alert information.
+    Optional fields/filter/limit/cursor return a page of items: fields projects (dotted) keys,
+    filter matches field values, and next_cursor continues a page cut by limit or the size budget.
+    """
+    try:
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return None
-        url = f'https://{aos_server}/api/alert-events'
-        response = httpx.get(url, headers=headers, verify=False)
-        response.raise_for_status()
-        data = response.json()
-        print("License API response:", data)
-        return data
+        url = f'https://{controller.server}/api/alert-events'
+        return await _paged_stream(controller, url, headers, fields, filter, limit, cursor)
     except Exception as e:
         print(f"An unexpected error occurred in get_alert: {e}", file=sys.stderr)
         return None
 
-def get_license() -> Optional[List[dict]]:
+@mcp.tool()
+async def get_alerts_since(cursor: Optional[str] = None, limit: Optional[int] = None, instance: Optional[str] = None) -> dict:
+    """
+    Gets alert events that are new or changed since cursor (all buffered events without one), oldest first.
+    Pass the returned cursor to the next call to get only what happened in between.
+    """
+    try:
+        return await _events_since("alerts", cursor, limit, instance)
+    except Exception as e:
+        return {"error": str(e)}
+
+@mcp.tool()
+async def get_metrics_since(cursor: Optional[str] = None, limit: Optional[int] = None, instance: Optional[str] = None) -> dict:
+    """
+    Gets metric records that are new or changed since cursor (all buffered records without one), oldest first.
+    Pass the returned cursor to the next call to get only what changed in between.
+    """
+    try:
+        return await _events_since("metrics", cursor, limit, instance)
+    except Exception as e:
+        return {"error": str(e)}
+
+async def get_license(instance: Optional[str] = None) -> Optional[List[dict]]:
     """Gets blueprint license information"""
     try:
-        headers = auth(aos_server, username, password)
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return None
-        url = f'https://{aos_server}/api/cluster/licenses'
-        response = httpx.get(url, headers=headers, verify=False)
+        url = f'https://{controller.server}/api/cluster/licenses'
+        response = await _request(controller, "GET", url, headers=headers)
         response.raise_for_status()
         data = response.json().get('items')
         print("License API response:", data)
@@ -400,65 +3072,81 @@ def get_license() -> Optional[List[dict]]:
         print(f"An unexpected error occurred in get_license: {e}", file=sys.stderr)
         return None
 
-def get_vni_pools() -> Optional[List[dict]]:
-    """Gets vni pools from blueprint information"""
+@mcp.tool()
+async def get_vni_pools(refresh: bool = False, instance: Optional[str] = None) -> Optional[List[dict]]:
+    """Gets the VNI pools (cached, set refresh=True to bypass)"""
     try:
-        headers = auth(aos_server, username, password)
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return None
-        url = f'https://{aos_server}/api/resources/vni-pools'
-        response = httpx.get(url, headers=headers, verify=False)
-        print("Status code:", response.status_code)
-        print ("Response body:", response.text)
-        response.raise_for_status()
-        data = response.json()
-        vni_data = data.get("items",[])
-        print("Full JSON:", data)
-
-        if vni_data is None:
-            print("No 'items' found, returning raw data", file=sys.stderr)
-        return vni_data
+        url = f'https://{controller.server}/api/resources/vni-pools'
+        data = await _cached_get(controller, url, headers, catalog_cache_ttl['/api/resources/vni-pools'], refresh)
+        return data.get('items', [])
     except Exception as e:
         print(f"An unexpected error occurred in get_vni_pools: {e}", file=sys.stderr)
         return None
 
 @mcp.tool()
-def get_systems(blueprint_id: str) -> Optional[List[dict]]:
-    """Gets Switches information from a blueprint"""
+async def get_systems(
+    blueprint_id: str,
+    fields: Optional[List[str]] = None,
+    filter: Optional[Dict[str, Any]] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    instance: Optional[str] = None
+) -> Union[List[dict], dict, None]:
+    """
+    Gets Switches information from a blueprint.
+    Optional fields/filter/limit/cursor return a page of items: fields projects (dotted) keys,
+    filter matches field values, and next_cursor continues a page cut by limit or the size budget.
+    """
     try:
-        headers = auth(aos_server, username, password)
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return None
-        url = f'https://{aos_server}/api/systems'
-        response = httpx.get(url, headers=headers, verify=False)
-        response.raise_for_status()
-        return response.json().get('items')
+        url = f'https://{controller.server}/api/systems'
+        return await _paged_stream(controller, url, headers, fields, filter, limit, cursor, items_only=True)
     except Exception as e:
-        print(f"An unexpected error occurred in get_devices_os: {e}", file=sys.stderr)
+        print(f"An unexpected error occurred in get_systems: {e}", file=sys.stderr)
         return None
 
 @mcp.tool() # new
-def create_security_zone(
+async def create_security_zone(
     blueprint_id: str,
     label: str,
-    vlan_id: int,
+    vlan_id: Optional[int] = None,
     route_target: str = None,
     vni: int = None,
-    vrf_name: str = None
+    vrf_name: str = None,
+    allocate: bool = False,
+    instance: Optional[str] = None
 ) -> Optional[dict]:
     """
     Creates a security zone in a given blueprint with VLAN ID, Route Target, sz_type and VNI.
+    With allocate=True a missing vlan_id and vni are taken from the free VLANs and VNI pools,
+    and given ones are checked for conflicts; otherwise vlan_id is required.
     """
+    reserved: Dict[str, int] = {}
+    created = None
     try:
-        headers = auth(aos_server, username, password)
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return {"error": "Authentication failed"}
 
-        url = f"https://{aos_server}/api/blueprints/{blueprint_id}/security-zones"
+        url = f"https://{controller.server}/api/blueprints/{blueprint_id}/security-zones"
 
         if vrf_name is None:
             vrf_name = label
 
+        if allocate:
+            reserved = await _reserve(controller, blueprint_id, headers, {"vlan": vlan_id, "vni": vni})
+            vlan_id, vni = reserved["vlan"], reserved["vni"]
+        elif vlan_id is None:
+            return {"error": "vlan_id is required unless allocate=True"}
+
         data = {
             "label": label,
             "vlan_id": vlan_id,
@@ -472,33 +3160,46 @@ def create_security_zone(
         if vni:
             data["vni_id"] = vni
 
-        response = httpx.post(url, json=data, headers=headers, verify=False)
+        response = await _request(
+            controller, "POST", url, json=data, headers=headers,
+            idempotency_check=_security_zone_created_check(controller, blueprint_id, headers, label)
+        )
+        invalidate_blueprint(controller, blueprint_id)
         response.raise_for_status()
-        return response.json()
+        created = response.json()
+        _index_write(controller, blueprint_id, lambda index: index.add_security_zone(created.get('id'), label, vlan_id, vni))
+        return created
     except httpx.HTTPStatusError as e:
         return {"error": f"HTTP {e.response.status_code}", "detail": e.response.text}
     except Exception as e:
         return {"error": str(e)}
+    finally:
+        if reserved:
+            _release(controller, blueprint_id, reserved, created is not None)
 
 @mcp.tool()
-def get_blueprint_metrics(blueprint_id: str) -> Optional[dict]:
+async def get_blueprint_metrics(
+    blueprint_id: str,
+    fields: Optional[List[str]] = None,
+    filter: Optional[Dict[str, Any]] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    instance: Optional[str] = None
+) -> Optional[dict]:
     """
     Retrieves operational metrics for a given blueprint.
     This may include resource utilization, system status, or traffic stats (depending on Apstra version).
+    Optional fields/filter/limit/cursor return a page of items: fields projects (dotted) keys,
+    filter matches field values, and next_cursor continues a page cut by limit or the size budget.
     """
     try:
-        headers = auth(aos_server, username, password)
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return None
 
-        url = f"https://{aos_server}/api/metricdb/metric"
-        response = httpx.get(url, headers=headers, verify=False)
-        response.raise_for_status()
-
-        metrics = response.json()
-
-        # Optionally log or filter here
-        return metrics
+        url = f"https://{controller.server}/api/metricdb/metric"
+        return await _paged_stream(controller, url, headers, fields, filter, limit, cursor)
 
     except httpx.HTTPStatusError as e:
         print(f"HTTP error in get_blueprint_metrics: {e.response.status_code} - {e.response.text}", file=sys.stderr)
@@ -508,57 +3209,55 @@ def get_blueprint_metrics(blueprint_id: str) -> Optional[dict]:
         return None
 
 @mcp.tool()
-def get_remote_gw (blueprint_id: str) -> Optional[dict]:
+async def get_remote_gw (blueprint_id: str, refresh: bool = False, instance: Optional[str] = None) -> Optional[dict]:
     """
-    get remote_gw information in blueprint
+    get remote_gw information in blueprint (cached per blueprint version)
     """
     try:
-        headers = auth(aos_server, username, password)
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return None
 
-        url = f"https://{aos_server}/api/blueprints/{blueprint_id}/remote_gateways"
-        response = httpx.get(url, headers=headers, verify=False)
-        response.raise_for_status()
-
-        metrics = response.json()
+        url = f"https://{controller.server}/api/blueprints/{blueprint_id}/remote_gateways"
+        metrics = await _blueprint_get(controller, blueprint_id, url, headers, refresh)
 
         # Optionally log or filter here
         return metrics
 
     except httpx.HTTPStatusError as e:
-        print(f"HTTP error in get_blueprint_metrics: {e.response.status_code} - {e.response.text}", file=sys.stderr)
+        print(f"HTTP error in get_remote_gw: {e.response.status_code} - {e.response.text}", file=sys.stderr)
         return {"error": f"{e.response.status_code} - {e.response.text}"}
     except Exception as e:
-        print(f"Unexpected error in get_blueprint_metrics: {e}", file=sys.stderr)
+        print(f"Unexpected error in get_remote_gw: {e}", file=sys.stderr)
         return None
 
 @mcp.tool()
-def get_property_set (blueprint_id: str) -> Optional[List[dict]]:
-    """Gets property set information from blueprint"""
+async def get_property_set (blueprint_id: str, refresh: bool = False, instance: Optional[str] = None) -> Optional[List[dict]]:
+    """Gets property set information from blueprint (cached per blueprint version)"""
     try:
-        headers = auth(aos_server, username, password)
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return None
-        url = f'https://{aos_server}/api/blueprints/{blueprint_id}/property-sets'
-        response = httpx.get(url, headers=headers, verify=False)
-        response.raise_for_status()
-        return response.json().get('items')
+        url = f'https://{controller.server}/api/blueprints/{blueprint_id}/property-sets'
+        data = await _blueprint_get(controller, blueprint_id, url, headers, refresh)
+        return data.get('items')
     except Exception as e:
-        print(f"An unexpected error occurred in get_devices_os: {e}", file=sys.stderr)
+        print(f"An unexpected error occurred in get_property_set: {e}", file=sys.stderr)
         return None
 
 @mcp.tool()
-def get_srx_configlet (blueprint_id: str) -> Optional[List[dict]]:
-    """Gets SRX property set information from blueprint"""
+async def get_srx_configlet (blueprint_id: str, refresh: bool = False, instance: Optional[str] = None) -> Optional[List[dict]]:
+    """Gets SRX property set information from blueprint (cached per blueprint version)"""
     try:
-        headers = auth(aos_server, username, password)
+        controller = get_controller(instance)
+        headers = await auth(controller)
         if not headers:
             return None
-        url = f'https://{aos_server}/api/blueprints/{blueprint_id}/configlets'
-        response = httpx.get(url, headers=headers, verify=False)
-        response.raise_for_status()
-        return response.json().get('items')
+        url = f'https://{controller.server}/api/blueprints/{blueprint_id}/configlets'
+        data = await _blueprint_get(controller, blueprint_id, url, headers, refresh)
+        return data.get('items')
     except Exception as e:
-        print(f"An unexpected error occurred in get_devices_os: {e}", file=sys.stderr)
+        print(f"An unexpected error occurred in get_srx_configlet: {e}", file=sys.stderr)
         return None
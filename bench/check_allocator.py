@@ -0,0 +1,95 @@
+"""
+Regression checks for the VNI/VLAN allocator (allocate=True on the create tools),
+run against the mock Apstra controller (bench/mock_apstra.py).
+
+    python bench/check_allocator.py     # exit 1 if any check fails
+"""
+import asyncio
+import os
+import sys
+from typing import Callable, List, Tuple
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import apstra_mcp  # noqa: E402
+from mock_apstra import create_app  # noqa: E402
+
+async def _fresh(**size):
+    """A new mock controller and a server with no connections, tokens or indexes yet"""
+    await apstra_mcp.close_controllers()
+    apstra_mcp._controllers = None
+    app = create_app(blueprints=1, **size)
+    apstra_mcp.http_transport = httpx.ASGITransport(app=app)
+    return next(iter(app.state.apstra.blueprints.values()))
+
+def _vnis(bp, prefix: str) -> List[int]:
+    return sorted(int(vn["vn_id"]) for vn in bp.virtual_networks.values() if vn["label"].startswith(prefix))
+
+async def delete_then_reallocate() -> None:
+    bp = await _fresh(security_zones=2, virtual_networks=4)
+    vn = next(vn for vn in bp.virtual_networks.values() if vn["label"] == "vn_0")
+    zone = vn["security_zone_id"]
+    # Build the index and allocator first, so the delete has to update them
+    assert "error" not in await apstra_mcp.create_vn(bp.id, zone, "warm", allocate=True)
+    result = await apstra_mcp.delete_vn(bp.id, zone, "vn_0")
+    assert "error" not in result, result
+    result = await apstra_mcp.create_vn(bp.id, zone, "vn_0", vni=int(vn["vn_id"]), allocate=True)
+    assert result and "error" not in result, result
+
+async def concurrent_allocations_are_distinct() -> None:
+    bp = await _fresh(security_zones=1, virtual_networks=10)
+    zone = next(iter(bp.security_zones))
+    results = await asyncio.gather(*(apstra_mcp.create_vn(bp.id, zone, f"a{i}", allocate=True) for i in range(20)))
+    assert all(r and "error" not in r for r in results), results
+    assert len(set(_vnis(bp, "a"))) == 20, _vnis(bp, "a")
+
+async def failed_create_releases_its_vni() -> None:
+    bp = await _fresh(security_zones=1, virtual_networks=0)
+    zone = next(iter(bp.security_zones))
+    result = await apstra_mcp.create_vns_bulk(bp.id, [
+        {"name": "ok", "security_zone_id": zone}, {"name": "bad", "security_zone_id": "no-such-zone"}
+    ], allocate=True)
+    assert result["created"] == 1, result
+    await apstra_mcp.create_vn(bp.id, zone, "next", allocate=True)
+    assert len(set(_vnis(bp, "ok") + _vnis(bp, "next"))) == 2
+    assert max(_vnis(bp, "ok") + _vnis(bp, "next")) - min(_vnis(bp, "ok") + _vnis(bp, "next")) == 1
+
+async def explicit_conflict_is_rejected() -> None:
+    bp = await _fresh(security_zones=1, virtual_networks=1)
+    zone = next(iter(bp.security_zones))
+    used = int(next(iter(bp.virtual_networks.values()))["vn_id"])
+    result = await apstra_mcp.create_vn(bp.id, zone, "dup", vni=used, allocate=True)
+    assert result and "already in use" in result.get("error", ""), result
+
+CHECKS: List[Tuple[str, Callable]] = [
+    ("delete_then_reallocate", delete_then_reallocate),
+    ("concurrent_allocations_are_distinct", concurrent_allocations_are_distinct),
+    ("failed_create_releases_its_vni", failed_create_releases_its_vni),
+    ("explicit_conflict_is_rejected", explicit_conflict_is_rejected),
+]
+
+async def run() -> int:
+    apstra_mcp.aos_server = "mock-apstra"
+    apstra_mcp.username = apstra_mcp.password = "bench"
+    os.environ.pop("APSTRA_CONTROLLERS", None)
+    failed = 0
+    try:
+        for name, check in CHECKS:
+            try:
+                await check()
+                print(f"ok      {name}")
+            except AssertionError as e:
+                failed += 1
+                print(f"FAILED  {name}: {e}")
+    finally:
+        await apstra_mcp.close_controllers()
+    return failed
+
+def main() -> None:
+    sys.exit(1 if asyncio.run(run()) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,499 @@
+"""
+Local stand-in for the Apstra REST API, used by the benchmarks.
+
+It serves the endpoints the MCP server calls (login, blueprints, racks,
+security zones, virtual networks, graph nodes, relationships and queries, diff status,
+deploy, systems, metricdb and the catalog endpoints) from synthetic blueprints of configurable size, with
+optional injected latency.
+
+In-process (no sockets):
+    app = create_app(blueprints=4, virtual_networks=500, latency=0.02)
+    apstra_mcp.http_transport = httpx.ASGITransport(app=app)
+
+As a standalone server (the MCP server always uses https):
+    python bench/mock_apstra.py --port 8443 --ssl-certfile cert.pem --ssl-keyfile key.pem
+"""
+import argparse
+import ast
+import asyncio
+import itertools
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+def _id() -> str:
+    return f"{random.getrandbits(80):020x}"
+
+class MockBlueprint:
+    """One synthetic blueprint. Every write bumps the staging version like Apstra does."""
+
+    def __init__(self, label: str, racks: int, security_zones: int, virtual_networks: int):
+        self.id = _id()
+        self.label = label
+        self.staging_version = 1
+        self.deployed_version = 1
+        self.deploy_status = "success"
+        self.racks = [
+            {"id": _id(), "label": f"rack_{r}", "rack_type_id": "L2_Virtual", "leafs": [f"leaf_{r}_1", f"leaf_{r}_2"]}
+            for r in range(racks)
+        ]
+        self.security_zones: Dict[str, dict] = {}
+        for z in range(security_zones):
+            self.add_security_zone({"label": f"rz_{z}", "vlan_id": 100 + z, "vni_id": 20000 + z, "sz_type": "evpn"})
+        zone_ids = list(self.security_zones)
+        self.virtual_networks: Dict[str, dict] = {}
+        for v in range(virtual_networks):
+            self.add_virtual_network({
+                "label": f"vn_{v}",
+                "vn_type": "vxlan",
+                "security_zone_id": zone_ids[v % len(zone_ids)] if zone_ids else None,
+                "vn_id": str(30000 + v),
+                "vlan_id": 1000 + v % 3000
+            })
+
+    def add_security_zone(self, data: dict) -> dict:
+        zone = dict(data, id=_id(), vrf_name=data.get("vrf_name") or data.get("label"))
+        self.security_zones[zone["id"]] = zone
+        return zone
+
+    def add_virtual_network(self, data: dict) -> dict:
+        vn = dict(data, id=_id())
+        self.virtual_networks[vn["id"]] = vn
+        return vn
+
+    def graph(self) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+        """Nodes and relationships of the blueprint graph: systems, racks, routing zones and VNs"""
+        nodes: Dict[str, dict] = {}
+        relationships: Dict[str, dict] = {}
+
+        def relate(rel_type: str, source_id: str, target_id: str) -> None:
+            rel_id = f"{source_id}>{rel_type}>{target_id}"
+            relationships[rel_id] = {"id": rel_id, "type": rel_type, "source_id": source_id, "target_id": target_id}
+
+        spines = [f"{self.id}-spine{s}" for s in (1, 2)]
+        for spine_id in spines:
+            nodes[spine_id] = {"id": spine_id, "type": "system", "label": spine_id[-6:], "role": "spine", "system_type": "switch"}
+        rack_leafs = []
+        for rack in self.racks:
+            nodes[rack["id"]] = {"id": rack["id"], "type": "rack", "label": rack["label"]}
+            leafs = []
+            for leaf_label in rack["leafs"]:
+                leaf_id = f"{rack['id']}-{leaf_label}"
+                nodes[leaf_id] = {"id": leaf_id, "type": "system", "label": leaf_label, "role": "leaf", "system_type": "switch"}
+                relate("part_of_rack", leaf_id, rack["id"])
+                for spine_id in spines:
+                    relate("link", spine_id, leaf_id)
+                leafs.append(leaf_id)
+            rack_leafs.append(leafs)
+        for zone in self.security_zones.values():
+            nodes[zone["id"]] = {"id": zone["id"], "type": "security_zone", "label": zone["label"],
+                                 "vrf_name": zone.get("vrf_name"), "vni_id": zone.get("vni_id")}
+        for position, vn in enumerate(self.virtual_networks.values()):
+            nodes[vn["id"]] = {"id": vn["id"], "type": "virtual_network", "label": vn["label"],
+                               "vn_type": vn.get("vn_type"), "vn_id": vn.get("vn_id")}
+            if vn.get("security_zone_id") in nodes:
+                relate("member_vns", vn["security_zone_id"], vn["id"])
+            for leaf_id in rack_leafs[position % len(rack_leafs)] if rack_leafs else []:
+                instance_id = f"{vn['id']}@{leaf_id}"
+                nodes[instance_id] = {"id": instance_id, "type": "vn_instance", "label": None}
+                relate("instantiated_by", vn["id"], instance_id)
+                relate("hosted_vn_instances", leaf_id, instance_id)
+        return nodes, relationships
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "label": self.label,
+            "design": "two_stage_l3clos",
+            "status": "created",
+            "version": self.staging_version,
+            "has_uncommitted_changes": self.staging_version != self.deployed_version
+        }
+
+    def diff_status(self) -> dict:
+        return {
+            "status": "undeployed" if self.staging_version != self.deployed_version else "deployed",
+            "staging_version": self.staging_version,
+            "deployed_version": self.deployed_version,
+            "deploy_status": self.deploy_status
+        }
+
+class MockApstra:
+    """State of the mock controller: blueprints, session tokens and fixed catalogs"""
+
+    def __init__(
+        self,
+        blueprints: int = 2,
+        racks: int = 4,
+        security_zones: int = 4,
+        virtual_networks: int = 100,
+        systems: int = 50,
+        metrics: int = 200,
+        alerts: int = 50,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        deploy_time: float = 0.5,
+        seed: Optional[int] = 0
+    ):
+        random.seed(seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.deploy_time = deploy_time
+        self.size = dict(racks=racks, security_zones=security_zones)
+        self.tokens = set()
+        self.requests = 0
+        self.blueprints: Dict[str, MockBlueprint] = {}
+        for b in range(blueprints):
+            bp = MockBlueprint(f"bp_{b}", racks, security_zones, virtual_networks)
+            self.blueprints[bp.id] = bp
+        self.templates = {
+            tid: {"id": tid, "display_name": name, "type": "rack_based"}
+            for tid, name in (("L2_Virtual_EVPN", "L2 Virtual EVPN"), ("L3_Collapsed", "L3 Collapsed ACS"))
+        }
+        self.systems = [
+            {
+                "id": _id(),
+                "device_key": f"5254{s:08X}",
+                "facts": {"hostname": f"leaf-{s}", "os_family": "junos", "os_version": "23.4R1", "hw_model": "QFX5120"},
+                "status": {"state": "OOS-READY" if s % 10 else "IS-ACTIVE", "comm_state": "on"},
+                "user_config": {"admin_state": "normal"}
+            }
+            for s in range(systems)
+        ]
+        self.metrics = [
+            {
+                "name": f"iba/{m % 7}/interface_counters",
+                "system_id": self.systems[m % len(self.systems)]["device_key"] if self.systems else None,
+                "value": random.random() * 1000,
+                "timestamp": time.time()
+            }
+            for m in range(metrics)
+        ]
+        self.alerts = [
+            {
+                "id": _id(),
+                "type": ("bgp", "cabling", "config_deviation", "interface")[a % 4],
+                "severity": ("critical", "major", "minor", "warning")[a % 4],
+                "raised": a % 3 != 0,
+                "timestamp": time.time() - a
+            }
+            for a in range(alerts)
+        ]
+
+    async def delay(self) -> None:
+        seconds = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    def blueprint(self, request: Request) -> Optional[MockBlueprint]:
+        return self.blueprints.get(request.path_params["blueprint_id"])
+
+class _ControllerBehaviour:
+    """ASGI middleware applying latency and token checks to every request, like a real controller"""
+
+    def __init__(self, app: ASGIApp, state: MockApstra):
+        self.app = app
+        self.state = state
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            self.state.requests += 1
+            await self.state.delay()
+            token = dict(scope.get("headers") or []).get(b"authtoken", b"").decode()
+            if scope["path"] != "/api/user/login" and token not in self.state.tokens:
+                await JSONResponse({"errors": "Invalid token"}, status_code=401)(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+def _parse_query(query: str) -> Tuple[List[List[Tuple[str, Optional[str], Dict[str, Any]]]], List[str]]:
+    """
+    Parse the subset of the graph query language used by query_blueprint:
+    match(node(...).out(...).node(...), ...).distinct([...]). Returns the paths
+    as (kind, type, keyword filters) steps and the distinct aliases.
+    """
+    def calls(expr: ast.expr) -> List[ast.Call]:
+        chain = []
+        while isinstance(expr, ast.Call):
+            chain.append(expr)
+            expr = expr.func.value if isinstance(expr.func, ast.Attribute) else None
+        return chain[::-1]
+
+    def value(expr: ast.expr) -> Any:
+        if isinstance(expr, ast.Call) and getattr(expr.func, "id", None) == "is_in":
+            return ("is_in", ast.literal_eval(expr.args[0]))
+        return ast.literal_eval(expr)
+
+    chain = calls(ast.parse(query, mode="eval").body)
+    if not chain or getattr(chain[0].func, "id", None) != "match":
+        raise ValueError("Only match(...) queries are supported")
+    distinct = [ast.literal_eval(arg) for call in chain[1:] if call.func.attr == "distinct" for arg in call.args]
+    paths = []
+    for path in chain[0].args:
+        steps = []
+        for call in calls(path):
+            kind = call.func.id if isinstance(call.func, ast.Name) else call.func.attr
+            kind = "in" if kind == "in_" else kind
+            steps.append((kind, ast.literal_eval(call.args[0]) if call.args else None,
+                          {kw.arg: value(kw.value) for kw in call.keywords}))
+        paths.append(steps)
+    return paths, distinct[0] if distinct else []
+
+def _run_query(query: str, nodes: Dict[str, dict], relationships: Dict[str, dict]) -> List[dict]:
+    """Evaluate a parsed query by backtracking over the blueprint graph"""
+    paths, distinct = _parse_query(query)
+    out_edges: Dict[str, List[dict]] = {}
+    in_edges: Dict[str, List[dict]] = {}
+    for rel in relationships.values():
+        out_edges.setdefault(rel["source_id"], []).append(rel)
+        in_edges.setdefault(rel["target_id"], []).append(rel)
+
+    def matches(obj: dict, type_: Optional[str], filters: Dict[str, Any]) -> bool:
+        if type_ is not None and obj.get("type") != type_:
+            return False
+        for key, expected in filters.items():
+            if key == "name":
+                continue
+            if isinstance(expected, tuple) and expected[0] == "is_in":
+                if obj.get(key) not in expected[1]:
+                    return False
+            elif obj.get(key) != expected:
+                return False
+        return True
+
+    def walk(steps, index: int, node_id: str, binding: dict):
+        kind, type_, filters = steps[index]
+        node = nodes[node_id]
+        if not matches(node, type_, filters):
+            return
+        name = filters.get("name")
+        if name is not None:
+            if name in binding and binding[name]["id"] != node_id:
+                return
+            binding = dict(binding, **{name: node})
+        if index + 1 == len(steps):
+            yield binding
+            return
+        edge_kind, edge_type, edge_filters = steps[index + 1]
+        edges = out_edges.get(node_id, []) if edge_kind == "out" else in_edges.get(node_id, [])
+        for rel in edges:
+            if matches(rel, edge_type, edge_filters) and index + 2 < len(steps):
+                other = rel["target_id"] if edge_kind == "out" else rel["source_id"]
+                edge_binding = dict(binding, **{edge_filters["name"]: rel}) if edge_filters.get("name") else binding
+                yield from walk(steps, index + 2, other, edge_binding)
+
+    results = [{}]
+    for steps in paths:
+        results = [found for binding in results for node_id in nodes for found in walk(steps, 0, node_id, binding)]
+    if distinct:
+        unique = {}
+        for result in results:
+            unique.setdefault(tuple(result.get(alias, {}).get("id") for alias in distinct),
+                              {alias: result.get(alias) for alias in distinct})
+        results = list(unique.values())
+    return results
+
+def _not_found() -> JSONResponse:
+    return JSONResponse({"errors": "Not found"}, status_code=404)
+
+def create_app(**size: Any) -> Starlette:
+    """Build the mock Apstra ASGI app; keyword arguments are passed to MockApstra"""
+    state = MockApstra(**size)
+    counter = itertools.count(1)
+
+    async def login(request: Request) -> Response:
+        body = await request.json()
+        if not body.get("username") or not body.get("password"):
+            return JSONResponse({"errors": "Invalid credentials"}, status_code=401)
+        token = f"mock-token-{next(counter)}"
+        state.tokens.add(token)
+        return JSONResponse({"token": token, "id": body["username"]}, status_code=201)
+
+    async def blueprints(request: Request) -> Response:
+        if request.method == "POST":
+            body = await request.json()
+            bp = MockBlueprint(body.get("label", "bp"), state.size["racks"], state.size["security_zones"], 0)
+            state.blueprints[bp.id] = bp
+            return JSONResponse({"id": bp.id}, status_code=201)
+        return JSONResponse({"items": [bp.summary() for bp in state.blueprints.values()]})
+
+    async def blueprint(request: Request) -> Response:
+        bp = state.blueprint(request)
+        if bp is None:
+            return _not_found()
+        if request.method == "DELETE":
+            del state.blueprints[bp.id]
+            return Response(status_code=202)
+        return JSONResponse(bp.summary())
+
+    async def racks(request: Request) -> Response:
+        bp = state.blueprint(request)
+        return JSONResponse({"items": bp.racks}) if bp else _not_found()
+
+    async def security_zones(request: Request) -> Response:
+        bp = state.blueprint(request)
+        if bp is None:
+            return _not_found()
+        if request.method == "POST":
+            body = await request.json()
+            if any(z["label"] == body.get("label") for z in bp.security_zones.values()):
+                return JSONResponse({"errors": {"label": "Label must be unique"}}, status_code=422)
+            zone = bp.add_security_zone(body)
+            bp.staging_version += 1
+            return JSONResponse({"id": zone["id"]}, status_code=201)
+        return JSONResponse({"items": bp.security_zones})
+
+    async def virtual_networks(request: Request) -> Response:
+        bp = state.blueprint(request)
+        if bp is None:
+            return _not_found()
+        if request.method == "POST":
+            body = await request.json()
+            if body.get("security_zone_id") not in bp.security_zones:
+                return JSONResponse({"errors": {"security_zone_id": "Unknown security zone"}}, status_code=422)
+            if body.get("vn_id") and any(vn.get("vn_id") == body["vn_id"] for vn in bp.virtual_networks.values()):
+                return JSONResponse({"errors": {"vn_id": "VNI already in use"}}, status_code=422)
+            vn = bp.add_virtual_network(body)
+            bp.staging_version += 1
+            return JSONResponse({"id": vn["id"]}, status_code=201)
+        return JSONResponse({"virtual_networks": bp.virtual_networks})
+
+    async def web_virtual_networks(request: Request) -> Response:
+        bp = state.blueprint(request)
+        if bp is None:
+            return _not_found()
+        return JSONResponse({"virtual_networks": bp.virtual_networks, "version": bp.staging_version})
+
+    async def delete_virtual_networks(request: Request) -> Response:
+        bp = state.blueprint(request)
+        if bp is None:
+            return _not_found()
+        body = await request.json()
+        for vn_id in body.get("virtual_network_ids", []):
+            bp.virtual_networks.pop(vn_id, None)
+        bp.staging_version += 1
+        return Response(status_code=202)
+
+    async def diff_status(request: Request) -> Response:
+        bp = state.blueprint(request)
+        return JSONResponse(bp.diff_status()) if bp else _not_found()
+
+    async def deploy(request: Request) -> Response:
+        bp = state.blueprint(request)
+        if bp is None:
+            return _not_found()
+        version = (await request.json()).get("version")
+        if version != bp.staging_version:
+            return JSONResponse({"errors": "Version mismatch"}, status_code=409)
+        bp.deploy_status = "in_progress"
+
+        async def finish() -> None:
+            await asyncio.sleep(state.deploy_time)
+            bp.deployed_version = max(bp.deployed_version, version)
+            bp.deploy_status = "success"
+        asyncio.get_running_loop().create_task(finish())
+        return JSONResponse({"version": version}, status_code=202)
+
+    async def graph_nodes(request: Request) -> Response:
+        bp = state.blueprint(request)
+        return JSONResponse({"nodes": bp.graph()[0]}) if bp else _not_found()
+
+    async def graph_relationships(request: Request) -> Response:
+        bp = state.blueprint(request)
+        return JSONResponse({"relationships": bp.graph()[1]}) if bp else _not_found()
+
+    async def graph_query(request: Request) -> Response:
+        bp = state.blueprint(request)
+        if bp is None:
+            return _not_found()
+        try:
+            items = _run_query((await request.json())["query"], *bp.graph())
+        except (KeyError, ValueError, SyntaxError) as e:
+            return JSONResponse({"errors": f"Invalid query: {e}"}, status_code=422)
+        return JSONResponse({"items": items, "count": len(items)})
+
+    async def blueprint_items(request: Request) -> Response:
+        bp = state.blueprint(request)
+        return JSONResponse({"items": []}) if bp else _not_found()
+
+    def collection(items: Any) -> Any:
+        async def endpoint(request: Request) -> Response:
+            return JSONResponse({"items": items})
+        return endpoint
+
+    async def version(request: Request) -> Response:
+        return JSONResponse({"version": "5.1.0-mock", "build_version": "5.1.0-mock"})
+
+    async def vni_pools(request: Request) -> Response:
+        return JSONResponse({"items": [{
+            "id": "default-vni-pool",
+            "display_name": "Default VNI pool",
+            "ranges": [{"first": 10000, "last": 19999}],
+            "used": 0
+        }]})
+
+    routes: List[Route] = [
+        Route("/api/user/login", login, methods=["POST"]),
+        Route("/api/blueprints", blueprints, methods=["GET", "POST"]),
+        Route("/api/blueprints/{blueprint_id}", blueprint, methods=["GET", "DELETE"]),
+        Route("/api/blueprints/{blueprint_id}/racks", racks),
+        Route("/api/blueprints/{blueprint_id}/security-zones", security_zones, methods=["GET", "POST"]),
+        Route("/api/blueprints/{blueprint_id}/virtual-networks", virtual_networks, methods=["GET", "POST"]),
+        Route("/api/blueprints/{blueprint_id}/experience/web/virtual-networks", web_virtual_networks),
+        Route("/api/blueprints/{blueprint_id}/delete-virtual-networks", delete_virtual_networks, methods=["POST"]),
+        Route("/api/blueprints/{blueprint_id}/diff-status", diff_status),
+        Route("/api/blueprints/{blueprint_id}/deploy", deploy, methods=["PUT"]),
+        Route("/api/blueprints/{blueprint_id}/nodes", graph_nodes),
+        Route("/api/blueprints/{blueprint_id}/relationships", graph_relationships),
+        Route("/api/blueprints/{blueprint_id}/qe", graph_query, methods=["POST"]),
+        Route("/api/blueprints/{blueprint_id}/remote_gateways", blueprint_items),
+        Route("/api/blueprints/{blueprint_id}/property-sets", blueprint_items),
+        Route("/api/blueprints/{blueprint_id}/configlets", blueprint_items),
+        Route("/api/systems", collection(state.systems)),
+        Route("/api/metricdb/metric", collection(state.metrics)),
+        Route("/api/alert-events", collection(state.alerts)),
+        Route("/api/design/templates", collection(state.templates)),
+        Route("/api/device-os/platforms", collection([{"id": "junos", "os_version": "23.4R1"}])),
+        Route("/api/chassis-profiles", collection([{"id": "Juniper_QFX5120-48Y", "hardware_capabilities": {}}])),
+        Route("/api/cluster/licenses", collection([])),
+        Route("/api/resources/vni-pools", vni_pools),
+        Route("/api/versions/server", version),
+    ]
+    app = Starlette(routes=routes, middleware=[Middleware(_ControllerBehaviour, state=state)])
+    app.state.apstra = state
+    return app
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a mock Apstra controller")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--ssl-certfile")
+    parser.add_argument("--ssl-keyfile")
+    parser.add_argument("--blueprints", type=int, default=2)
+    parser.add_argument("--racks", type=int, default=4)
+    parser.add_argument("--security-zones", type=int, default=4)
+    parser.add_argument("--virtual-networks", type=int, default=100)
+    parser.add_argument("--systems", type=int, default=50)
+    parser.add_argument("--metrics", type=int, default=200)
+    parser.add_argument("--alerts", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra seconds, up to this value")
+    args = parser.parse_args()
+
+    import uvicorn
+    app = create_app(
+        blueprints=args.blueprints, racks=args.racks, security_zones=args.security_zones,
+        virtual_networks=args.virtual_networks, systems=args.systems, metrics=args.metrics,
+        alerts=args.alerts, latency=args.latency, jitter=args.jitter
+    )
+    uvicorn.run(app, host=args.host, port=args.port, ssl_certfile=args.ssl_certfile,
+                ssl_keyfile=args.ssl_keyfile, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+Benchmark the MCP server against the mock Apstra controller (bench/mock_apstra.py).
+
+Every scenario drives one tool at each concurrency level, either by calling the
+tool function directly (inprocess) or through an MCP client session (mcp), and
+reports p50/p99 latency, throughput and memory.
+
+    python bench/run_bench.py --concurrency 1,8,32 --latency 0.005 --json bench.json
+    python bench/run_bench.py --baseline bench.json --tolerance 0.25   # exit 1 on regression
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import apstra_mcp  # noqa: E402
+from mock_apstra import MockBlueprint, create_app  # noqa: E402
+
+ToolCall = Callable[[str, Dict[str, Any]], Awaitable[bool]]
+
+def _scenarios(state, max_concurrency: int) -> Dict[str, Callable[[int], Tuple[str, Dict[str, Any]]]]:
+    """
+    Scenario name -> function of the iteration number returning (tool name, arguments).
+    The functions run outside the timed call, so delete scenarios seed what they delete
+    in the mock first (a change by someone else, as far as the server can tell).
+    """
+    blueprints = list(state.blueprints.values())
+    first = blueprints[0]
+    zone_id = next(iter(first.security_zones))
+    zone_label = first.security_zones[zone_id]["label"]
+    template = next(iter(state.templates.values()))["display_name"]
+
+    def spread(i: int) -> str:
+        return blueprints[i % len(blueprints)].id
+
+    def seed_vns(i: int, count: int) -> List[Dict[str, str]]:
+        items = []
+        for n in range(count):
+            name = f"bench_del_{i}_{n}_{time.monotonic_ns()}"
+            first.add_virtual_network({"label": name, "vn_type": "vxlan", "security_zone_id": zone_id})
+            items.append({"name": name, "security_zone_id": zone_label})
+        first.staging_version += 1
+        return items
+
+    def seed_blueprint(i: int) -> str:
+        bp = MockBlueprint(f"bench_bp_{i}", 1, 1, 0)
+        state.blueprints[bp.id] = bp
+        return bp.id
+
+    def drop_bench_blueprints() -> None:
+        """Keep blueprints created by the create scenario from piling up in the listings"""
+        for bp_id in [bp.id for bp in state.blueprints.values() if bp.label.startswith("bench_new_")]:
+            del state.blueprints[bp_id]
+
+    def new_blueprint(i: int) -> Tuple[str, Dict[str, Any]]:
+        drop_bench_blueprints()
+        return "create_blueprint_from_template", {"label": f"bench_new_{i}_{time.monotonic_ns()}", "template_name": template}
+
+    def deploy_args(i: int) -> Dict[str, Any]:
+        bp = blueprints[i % len(blueprints)]
+        return {"blueprint_id": bp.id, "description": f"bench {i}", "staging_version": bp.staging_version}
+
+    deploy_pool: List[MockBlueprint] = []
+
+    def pending_change(i: int) -> str:
+        """
+        Bump the staging version of a blueprint from a pool only deploy_and_wait uses, so it has
+        something to wait for; the pool is large enough that concurrent calls do not deploy the same one
+        """
+        if not deploy_pool:
+            for n in range(2 * max_concurrency):
+                bp = MockBlueprint(f"bench_deploy_{n}", 1, 1, 0)
+                state.blueprints[bp.id] = bp
+                deploy_pool.append(bp)
+        bp = deploy_pool[i % len(deploy_pool)]
+        bp.staging_version += 1
+        return bp.id
+
+    return {
+        "get_bp": lambda i: ("get_bp", {}),
+        "get_racks": lambda i: ("get_racks", {"blueprint_id": spread(i)}),
+        "get_rz": lambda i: ("get_rz", {"blueprint_id": spread(i)}),
+        "list_virtual_networks": lambda i: ("list_virtual_networks", {"blueprint_id": spread(i)}),
+        "get_diff_status": lambda i: ("get_diff_status", {"blueprint_id": spread(i)}),
+        "get_property_set": lambda i: ("get_property_set", {"blueprint_id": spread(i)}),
+        "get_srx_configlet": lambda i: ("get_srx_configlet", {"blueprint_id": spread(i)}),
+        "get_remote_gw": lambda i: ("get_remote_gw", {"blueprint_id": spread(i)}),
+        "get_apstra_version": lambda i: ("get_apstra_version", {}),
+        "get_chassis_profiles": lambda i: ("get_chassis_profiles", {"blueprint_id": first.id}),
+        "get_devices_os": lambda i: ("get_devices_os", {"blueprint_id": first.id}),
+        "get_vni_pools": lambda i: ("get_vni_pools", {}),
+        "get_instances": lambda i: ("get_instances", {}),
+        "get_cache_stats": lambda i: ("get_cache_stats", {}),
+        "server_stats": lambda i: ("server_stats", {}),
+        "get_alerts_since": lambda i: ("get_alerts_since", {"limit": 100}),
+        "get_metrics_since": lambda i: ("get_metrics_since", {"limit": 100}),
+        "get_systems_page": lambda i: ("get_systems", {
+            "blueprint_id": first.id, "fields": ["id", "facts.hostname", "status.state"], "limit": 50
+        }),
+        "get_blueprint_metrics": lambda i: ("get_blueprint_metrics", {"blueprint_id": first.id, "limit": 100}),
+        "get_fabric_snapshot": lambda i: ("get_fabric_snapshot", {}),
+        "query_blueprint_graph": lambda i: ("query_blueprint_graph", {
+            "blueprint_id": spread(i), "query": "vn_leafs", "node": f"vn_{i % 100}"
+        }),
+        "query_blueprint": lambda i: ("query_blueprint", {
+            "blueprint_id": spread(i),
+            "match": [[
+                {"node": "virtual_network", "label": f"vn_{i % 100}"}, {"out": "instantiated_by"},
+                {"node": "vn_instance"}, {"in": "hosted_vn_instances"}, {"node": "system", "name": "leaf", "role": "leaf"}
+            ]]
+        }),
+        "create_vn": lambda i: ("create_vn", {
+            "blueprint_id": first.id, "security_zone_id": zone_id, "vn_name": f"bench_vn_{i}_{time.monotonic_ns()}"
+        }),
+        "create_vn_allocate": lambda i: ("create_vn", {
+            "blueprint_id": first.id, "security_zone_id": zone_id, "vn_name": f"bench_alloc_{i}_{time.monotonic_ns()}",
+            "allocate": True
+        }),
+        "create_vns_bulk": lambda i: ("create_vns_bulk", {
+            "blueprint_id": first.id,
+            "virtual_networks": [
+                {"name": f"bench_bulk_{i}_{n}_{time.monotonic_ns()}", "security_zone_id": zone_id} for n in range(10)
+            ]
+        }),
+        "delete_vn": lambda i: ("delete_vn", {
+            "blueprint_id": first.id, "security_zone_id": zone_label, "vn_name": seed_vns(i, 1)[0]["name"]
+        }),
+        "delete_vns_bulk": lambda i: ("delete_vns_bulk", {"blueprint_id": first.id, "virtual_networks": seed_vns(i, 10)}),
+        "create_security_zone": lambda i: ("create_security_zone", {
+            "blueprint_id": first.id, "label": f"bench_rz_{i}_{time.monotonic_ns()}", "vlan_id": 2 + i % 4000
+        }),
+        "deploy": lambda i: ("deploy", deploy_args(i)),
+        "deploy_and_wait": lambda i: ("deploy_and_wait", {"blueprint_id": pending_change(i), "description": f"bench {i}"}),
+        "create_blueprint_from_template": new_blueprint,
+        "delete_bp": lambda i: ("delete_bp", {"blueprint_id": seed_blueprint(i)}),
+    }
+
+def _failed(result: Any) -> bool:
+    return result is None or (isinstance(result, dict) and "error" in result)
+
+async def _reset_controllers() -> None:
+    """Start every measurement with fresh connection pools, tokens and caches"""
+    await apstra_mcp.close_controllers()
+    apstra_mcp._controllers = None
+
+async def _drive(call: ToolCall, scenario: Callable[[int], Tuple[str, Dict[str, Any]]],
+                 iterations: int, concurrency: int) -> Tuple[List[float], int, float]:
+    """Run iterations calls with concurrency workers; returns (latencies, errors, wall seconds)"""
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker() -> None:
+        nonlocal errors
+        while (i := next(counter)) < iterations:
+            name, args = scenario(i)
+            started = time.perf_counter()
+            ok = await call(name, args)
+            latencies.append(time.perf_counter() - started)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+def _quantile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+async def _measure(call: ToolCall, scenario, iterations: int, concurrency: int, warmup: int, memory: bool) -> dict:
+    await _reset_controllers()
+    await _drive(call, scenario, warmup, min(concurrency, max(warmup, 1)))
+    latencies, errors, wall = await _drive(call, scenario, iterations, concurrency)
+    result = {
+        "calls": len(latencies),
+        "errors": errors,
+        "p50_ms": round(_quantile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(_quantile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 2),
+        "throughput": round(len(latencies) / wall, 1) if wall else 0.0,
+    }
+    if memory:
+        # Separate, shorter pass: tracemalloc slows every allocation down
+        tracemalloc.start()
+        await _drive(call, scenario, min(iterations, 50), concurrency)
+        result["peak_kib"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        tracemalloc.stop()
+    return result
+
+async def run(args: argparse.Namespace) -> List[dict]:
+    app = create_app(
+        blueprints=args.blueprints, racks=args.racks, security_zones=args.security_zones,
+        virtual_networks=args.virtual_networks, systems=args.systems, metrics=args.metrics,
+        latency=args.latency, jitter=args.jitter, deploy_time=args.deploy_time
+    )
+    apstra_mcp.http_transport = httpx.ASGITransport(app=app)
+    apstra_mcp.aos_server = "mock-apstra"
+    apstra_mcp.username = apstra_mcp.password = "bench"
+    apstra_mcp.deploy_poll_initial = args.deploy_poll
+    if args.no_cache:
+        apstra_mcp.cache_max_entries = 0
+    os.environ.pop("APSTRA_CONTROLLERS", None)
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+    scenarios = _scenarios(app.state.apstra, max(levels))
+    selected = args.scenarios.split(",") if args.scenarios else list(scenarios)
+    unknown = [name for name in selected if name not in scenarios]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)} (known: {', '.join(scenarios)})")
+    modes = ["inprocess", "mcp"] if args.mode == "both" else [args.mode]
+
+    async def inprocess(name: str, arguments: Dict[str, Any]) -> bool:
+        return not _failed(await getattr(apstra_mcp, name)(**arguments))
+
+    results = []
+    for mode in modes:
+        client = None
+        if mode == "mcp":
+            from fastmcp import Client
+            client = Client(apstra_mcp.mcp)
+            await client.__aenter__()
+
+        async def over_mcp(name: str, arguments: Dict[str, Any]) -> bool:
+            result = await client.call_tool(name, arguments, raise_on_error=False)
+            return not result.is_error and not _failed(result.structured_content) \
+                and result.structured_content != {"result": None}
+
+        call = over_mcp if mode == "mcp" else inprocess
+        try:
+            for name in selected:
+                for concurrency in levels:
+                    measured = await _measure(call, scenarios[name], args.iterations, concurrency,
+                                              args.warmup, not args.no_memory)
+                    row = {"mode": mode, "scenario": name, "concurrency": concurrency, **measured}
+                    results.append(row)
+                    _print_row(row)
+        finally:
+            if client is not None:
+                await client.__aexit__(None, None, None)
+            await _reset_controllers()
+    return results
+
+def _print_row(row: dict) -> None:
+    if not getattr(_print_row, "header", False):
+        print(f"{'mode':<10} {'scenario':<30} {'conc':>5} {'calls':>6} {'err':>4} {'p50 ms':>9} "
+              f"{'p99 ms':>9} {'max ms':>9} {'ops/s':>9} {'peak KiB':>9}")
+        _print_row.header = True
+    print(f"{row['mode']:<10} {row['scenario']:<30} {row['concurrency']:>5} {row['calls']:>6} {row['errors']:>4} "
+          f"{row['p50_ms']:>9} {row['p99_ms']:>9} {row['max_ms']:>9} {row['throughput']:>9} "
+          f"{row.get('peak_kib', '-'):>9}", flush=True)
+
+def compare(results: List[dict], baseline: List[dict], tolerance: float) -> List[str]:
+    """Return a description of every result that is slower than the baseline by more than tolerance"""
+    previous = {(r["mode"], r["scenario"], r["concurrency"]): r for r in baseline}
+    regressions = []
+    for row in results:
+        base = previous.get((row["mode"], row["scenario"], row["concurrency"]))
+        if base is None:
+            continue
+        label = f"{row['mode']} {row['scenario']} x{row['concurrency']}"
+        for key in ("p50_ms", "p99_ms"):
+            if base[key] and row[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{label}: {key} {base[key]} -> {row[key]}")
+        if base["throughput"] and row["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {base['throughput']} -> {row['throughput']}")
+        if row["errors"] > base["errors"]:
+            regressions.append(f"{label}: errors {base['errors']} -> {row['errors']}")
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the Apstra MCP server against a mock controller")
+    parser.add_argument("--mode", choices=["inprocess", "mcp", "both"], default="both")
+    parser.add_argument("--scenarios", help="comma-separated scenario names (default: all)")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--iterations", type=int, default=200, help="calls per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--no-cache", action="store_true", help="disable the response cache")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--blueprints", type=int, default=4)
+    parser.add_argument("--racks", type=int, default=8)
+    parser.add_argument("--security-zones", type=int, default=8)
+    parser.add_argument("--virtual-networks", type=int, default=500)
+    parser.add_argument("--systems", type=int, default=200)
+    parser.add_argument("--metrics", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.005, help="mock controller latency per request (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra mock latency, up to this value (s)")
+    parser.add_argument("--deploy-time", type=float, default=0.02, help="time the mock takes to finish a deploy (s)")
+    parser.add_argument("--deploy-poll", type=float, default=0.01,
+                        help="first diff-status poll interval of deploy_and_wait (s)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown vs. the baseline")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    max_rss_mib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"max RSS: {max_rss_mib:.1f} MiB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "max_rss_mib": round(max_rss_mib, 1), "results": results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()